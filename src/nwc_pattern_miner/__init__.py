@@ -1 +1,2 @@
-from .module import mine_sequence_patterns
+from .module import mine_sequence_patterns, mine_multi_series_patterns
+from .module import mine_threshold_sweep, MiningSession
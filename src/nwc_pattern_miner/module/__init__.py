@@ -1 +1,2 @@
-from .pattern_mining_client import mine_sequence_patterns
+from .pattern_mining_client import mine_sequence_patterns, mine_multi_series_patterns
+from .pattern_mining_client import mine_threshold_sweep, MiningSession
@@ -1,3 +1,6 @@
 from .candidatepattern import EnumeratedPattern
+from .metricstore import MetricStore
 from .latticegraph import LatticeGraph
+from .bitmasklattice import BitmaskLattice
+from .lazylattice import LazyLattice
 from .latticenode import LatticeNode
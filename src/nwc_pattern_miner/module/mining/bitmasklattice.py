@@ -0,0 +1,107 @@
+# Array backed lattice of all subsets, nodes are dimension bitmasks
+# Topology (levels, parents / children as bit flips) is shared per number of dimensions,
+# only the pruning state is reset for every window
+import numpy as np
+
+from ..utilities import mask_to_dimensions
+
+# File specific constants
+prune_types = ['parents', 'children']
+
+# {num_of_dim: (levels, dimensions)} shared across lattice instances
+_topology_cache = dict()
+
+
+def _get_topology(num_of_dim: int) -> tuple:
+    """Summary
+        masks of every level (depth 0 is the root, ascending masks within a level,
+    same as LatticeGraph) and the dimensions of every mask, computed once per num_of_dim
+    """
+    if num_of_dim not in _topology_cache:
+        masks = np.arange(1, 2 ** num_of_dim, dtype=np.int64)
+        popcount = np.zeros(len(masks), dtype=np.int64)
+        for dim in range(num_of_dim):
+            popcount += (masks >> dim) & 1
+
+        levels = [masks[popcount == num_of_dim - depth] for depth in range(num_of_dim)]
+        dimensions = [()] + [mask_to_dimensions(mask) for mask in masks.tolist()]
+        _topology_cache[num_of_dim] = (levels, dimensions)
+
+    return _topology_cache[num_of_dim]
+
+
+class BitmaskLattice:
+
+    def __init__(self, num_of_dim: int):
+        # Node state is stored in arrays indexed by the node's bitmask
+        self._num_of_dim = num_of_dim
+        self._levels, self._dimensions = _get_topology(num_of_dim)
+        self.num_of_nodes = 2 ** num_of_dim - 1
+
+        self._all_masks = np.arange(2 ** num_of_dim, dtype=np.int64)
+        self._is_pruned = np.zeros(2 ** num_of_dim, dtype=bool)
+        self._superpattern_count = np.full(2 ** num_of_dim, -1, dtype=np.int64)
+
+    def reset(self) -> None:
+        """Summary
+            clears pruning state and superpattern counts, for a new window
+        """
+        self._is_pruned.fill(False)
+        self._superpattern_count.fill(-1)
+
+    def get_level(self, depth: int) -> list:
+        """Summary
+            returns node masks at a depth (depth 0 is the root)
+        """
+        return self._levels[depth].tolist()
+
+    def get_dimensions(self, mask: int) -> tuple:
+        return self._dimensions[mask]
+
+    def is_node_pruned(self, mask: int) -> bool:
+        return self._is_pruned[mask]
+
+    def prune_node(self, mask: int) -> None:
+        self._is_pruned[mask] = True
+
+    def get_superpattern_count(self, mask: int) -> int:
+        return self._superpattern_count[mask]
+
+    def set_superpattern_count(self, mask: int, count: int) -> None:
+        self._superpattern_count[mask] = count
+
+    def get_parents(self, mask: int) -> list:
+        """Summary
+            supersets with one more dimension (a bit set)
+        """
+        return [mask | (1 << dim) for dim in range(self._num_of_dim) if not mask & (1 << dim)]
+
+    def get_children(self, mask: int) -> list:
+        """Summary
+            subsets with one less dimension (a bit cleared), singletons have no children
+        """
+        if mask & (mask - 1) == 0:
+            return list()
+
+        return [mask ^ (1 << dim) for dim in self._dimensions[mask]]
+
+    def prune_nodes(self, mask: int, prune_type: str) -> int:
+        """Summary
+            prunes node and either all of its supersets (parents) or subsets (children)
+        in a single vectorised pass, returns the exact number of nodes newly pruned
+        Args:
+            mask (int): bitmask of the node
+            prune_type (str): Parents or children
+        """
+        if prune_type == prune_types[0]:
+            to_prune = (self._all_masks & mask) == mask
+        elif prune_type == prune_types[1]:
+            to_prune = (self._all_masks & ~mask) == 0
+            to_prune[0] = False
+        else:
+            raise Exception('Wrong prune type provided')
+
+        num_of_pruned_nodes = np.count_nonzero(to_prune & ~self._is_pruned)
+        self._is_pruned |= to_prune
+
+        return int(num_of_pruned_nodes)
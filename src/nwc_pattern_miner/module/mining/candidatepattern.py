@@ -2,48 +2,72 @@
 Hashes / enumerates patterns, finds top patterns
 """
 import sys
+import heapq
+import hashlib
 import numpy as np
 import pandas as pd
-from ..utilities import print_fun
-from collections import OrderedDict
+from ..utilities import print_fun, mask_to_dimensions, dimensions_to_mask
+from ..utilities import SegmentBoundaries
+from .metricstore import MetricStore
 
 # Specific constants
-short_window_bin_size = 50  # Assuming pattern length would not be greater
 patterns_alert_threshold = 10000
 metric_names = ['support', 'crossk', 'confidence']
 metric_col_names = ['Count', 'Support', 'Kvalue',
                     'Confidence', 'First Occurrence Index']
+metric_store_dtypes = {'patterncount': np.int64, 'joinset_cardinality': np.int64,
+                       'unique_joinset_cardinality': np.int64, 'support': np.float64,
+                       'confidence': np.float64, 'crossk': np.float64,
+                       'above_some_threshold': bool, 'first_occurence': np.int64}
+# first: only first occurence index (and counts) kept, compressed: all occurences kept
+# delta encoded, ranked: all occurences kept for patterns ranking in the output
+occurence_retention_types = ['first', 'compressed', 'ranked']
 
 class EnumeratedPattern:
 
     def __init__(self, anomalous_windows: list, num_of_readings: int,
-                 lag: int) -> None:
+                 lag: int, occurence_retention: str = 'first',
+                 segment_boundaries: SegmentBoundaries = None) -> None:
         """Summary
-        patterns: to store already visited patterns (serialised dataframe segments)
-        occurences: all positions of each pattern sequence
-        features: dimensions involved in the dataframe segment
-        support, confidence, crossk: support of the enumerated patterns
+        patterns: to store already visited patterns (compact pattern keys)
+        occurences: {pattern index: occurences retained}, see occurence_retention_types
+        metric_store: columns (count, joinsets, support, confidence, crossk, flags,
+        first occurence) of the enumerated patterns, row per pattern
         anomalous_windows (list): occurences of anomalous windows
+        segment_boundaries: if provided, joinsets do not look across segment boundaries
         """
+        if occurence_retention not in occurence_retention_types:
+            raise Exception('Invalid occurence retention type provided')
+
         self._lag = lag
         self._num_of_readings = num_of_readings
         self._anomalous_windows = anomalous_windows
         self._crossk_const = num_of_readings / len(anomalous_windows)
+        self._occurence_retention = occurence_retention
+        self._retention_rank = None
+        self._segment_boundaries = segment_boundaries
+
+        # anomalous windows within lag of each reading, for joinset range queries
+        self._window_anomaly_counts = self._create_window_anomaly_counts()
+
+        self.reset()
 
+    def reset(self) -> None:
+        """Summary
+            forgets all enumerated patterns, keeping the configuration
+        """
         self.num_of_patterns = 0
-        self._patterns = OrderedDict()
-        self._occurences = list()
-        self._patterncount = list()
-        self._joinset_cardinality = list()
-        self._unique_joinset_cardinality = list()
-        self._support = list()
-        self._confidence = list()
-        self._crossk = list()
-        self._above_some_threshold = list()
-        self._anomalous_windows_map = dict()
-
-        # break anomalous windows for range queries
-        self._create_short_anomalous_windows()
+        self._patterns = dict()
+        self._pattern_keys = list()
+        self._metric_store = MetricStore(metric_store_dtypes)
+        self._occurences = dict()
+        self._ranked_heap = list()
+        # ranked retention: patterns holding occurences until flagged for a threshold
+        self._unranked_indexes = set()
+
+        # bytes held by pattern keys and retained occurences, for memory reporting
+        self._key_nbytes = 0
+        self._occurence_nbytes = 0
 
     def get_lag(self):
         return self._lag
@@ -54,190 +78,545 @@ class EnumeratedPattern:
     def get_num_of_readings(self):
         return self._num_of_readings
 
-    def _create_short_anomalous_windows(self) -> dict:
-        # Create a hashmap to shorten and store anomalous windows
-        for i in self._anomalous_windows:
-            key = i // short_window_bin_size
-            if key not in self._anomalous_windows_map:
-                self._anomalous_windows_map[key] = list()
-
-            self._anomalous_windows_map[key].append(i)
+    def get_config(self) -> dict:
+        """Summary
+            enumeration settings, the target as a fingerprint of its anomalous windows
+        """
+        target_fingerprint = hashlib.blake2b(
+            np.asarray(self._anomalous_windows, dtype=np.int64).tobytes(), digest_size=16)
+        retention_rank = self._retention_rank
+        if retention_rank is not None:
+            metric, filter_type, k, threshold = retention_rank
+            retention_rank = [metric, filter_type, int(k), float(threshold)]
+
+        return {'lag': int(self._lag), 'num_of_readings': int(self._num_of_readings),
+                'target': target_fingerprint.hexdigest(),
+                'occurence_retention': self._occurence_retention,
+                'retention_rank': retention_rank}
+
+    def _create_window_anomaly_counts(self) -> np.ndarray:
+        """Summary
+            Number of anomalous windows in [index, index + lag] for every index, as a
+        difference of prefix sums over the anomaly indicator
+        """
+        is_anomalous = np.zeros(self._num_of_readings, dtype=np.int64)
+        is_anomalous[self._anomalous_windows] = 1
 
-    def _get_short_anomalous_windows(self, index) -> list:
-        # Only get anomalous windows of length 100, to make search faster
-        key = index // short_window_bin_size
+        anomaly_prefix_sums = np.zeros(self._num_of_readings + 1, dtype=np.int64)
+        np.cumsum(is_anomalous, out=anomaly_prefix_sums[1:])
 
-        if key not in self._anomalous_windows_map:
-            return list()
+        indexes = np.arange(self._num_of_readings)
+        window_ends = np.minimum(indexes + self._lag + 1, self._num_of_readings)
+        if self._segment_boundaries is not None:
+            window_ends = np.minimum(window_ends, self._segment_boundaries.get_segment_ends())
 
-        return self._anomalous_windows_map[key]
+        return anomaly_prefix_sums[window_ends] - anomaly_prefix_sums[indexes]
 
-    def enumerate_pattern(self, pattern_str: str, pattern_occurences: int) -> None:
+    def enumerate_pattern(self, pattern_key: tuple, pattern_occurences) -> None:
         """Summary
             Onboards a patterns (counting all it's metrics)
         Args:
-            pattern_str (str): dataframe segment representing sequence, as a string
+            pattern_key (tuple): compact key representing sequence (dimension bitmask, window ids)
+            pattern_occurences (OccurenceSet): start offsets of the pattern
+        """
+        self.enumerate_patterns([pattern_key], [pattern_occurences])
+
+    def enumerate_patterns(self, pattern_keys: list, patterns_occurences: list) -> None:
+        """Summary
+            Onboards a batch of patterns, metrics of the batch computed at once.
+        Already enumerated patterns are skipped
+        Args:
+            pattern_keys (list): compact keys of the patterns
+            patterns_occurences (list): OccurenceSet of every pattern
         """
-        # pattern already enumerated
-        if self.find_pattern(pattern_str) != -1:
+        new_occurences = list()
+        for pattern_key, pattern_occurences in zip(pattern_keys, patterns_occurences):
+            # pattern already enumerated
+            if pattern_key in self._patterns:
+                continue
+
+            # Add pattern to enumeration list
+            self._patterns[pattern_key] = self.num_of_patterns + len(new_occurences)
+            self._pattern_keys.append(pattern_key)
+            self._key_nbytes += _get_key_nbytes(pattern_key)
+            new_occurences.append(pattern_occurences)
+
+        if len(new_occurences) == 0:
             return
 
-        # Add pattern to enumeration list
-        # self._patterns.append(pattern_str)
-        self._patterns[pattern_str] = self.num_of_patterns
+        patterncounts = np.array([len(x) for x in new_occurences], dtype=np.int64)
+        joinset_counts, unique_joinset_counts = self._count_pattern_joinsets(new_occurences)
+
+        self._metric_store.append_rows({
+            'patterncount': patterncounts,
+            'joinset_cardinality': joinset_counts,
+            'unique_joinset_cardinality': unique_joinset_counts,
+            'support': joinset_counts / self._num_of_readings,
+            'confidence': unique_joinset_counts / patterncounts,
+            'crossk': self._crossk_const * (joinset_counts / patterncounts),
+            # Would be later changed when checking for threshold
+            'above_some_threshold': np.ones(len(new_occurences), dtype=bool),
+            'first_occurence': [x.get_first_index() for x in new_occurences]})
+
+        if self._occurence_retention == 'compressed':
+            for pattern_index, pattern_occurences in enumerate(new_occurences,
+                                                               self.num_of_patterns):
+                self._retain_occurences(pattern_index, pattern_occurences.get_indexes())
+
+        elif self._occurence_retention == 'ranked':
+            # ranked once flagged (is_above_threshold), patterns below are not ranked
+            for pattern_index, pattern_occurences in enumerate(new_occurences,
+                                                               self.num_of_patterns):
+                self._add_occurences(pattern_index, pattern_occurences.get_indexes())
+                self._unranked_indexes.add(pattern_index)
+
+        self._count_new_patterns(len(new_occurences))
+
+    def _count_new_patterns(self, num_of_new_patterns: int) -> None:
+        """Summary
+            Monitoring memory size of instance
+        """
+        previous_num_of_patterns = self.num_of_patterns
+        self.num_of_patterns += num_of_new_patterns
+        if (self.num_of_patterns // patterns_alert_threshold !=
+                previous_num_of_patterns // patterns_alert_threshold):
+            print_fun(self)
 
-        # Would be later changed when checking for threshold
-        self._above_some_threshold.append(True)
+    def export_patterns(self) -> tuple:
+        """Summary
+            returns enumerated patterns as (keys, {column: values}, {pattern index:
+        retained occurences}), to be merged into another instance
+        """
+        columns = {name: self._metric_store.get_column(name).copy()
+                   for name in metric_store_dtypes}
 
-        self._fill_pattern_counts(pattern_occurences)
+        return list(self._pattern_keys), columns, self._occurences
 
-        self._fill_pattern_joinsets(pattern_occurences)
+    def get_snapshot(self) -> dict:
+        """Summary
+            enumerated patterns and their metrics as plain arrays (for np.savez), keys
+        stored as their number of dimensions, concatenated dimensions and window ids
+        (masks of more than 63 dimensions do not fit an int64)
+        """
+        pattern_keys = self._pattern_keys
+        retained_indexes = sorted(self._occurences.keys())
+        retained_occurences = [self.get_pattern_occurences(i) for i in retained_indexes]
+
+        snapshot = {
+            'config': np.array([self._lag, self._num_of_readings], dtype=np.int64),
+            'anomalous_windows': np.asarray(self._anomalous_windows, dtype=np.int64),
+            'occurence_retention': np.array(self._occurence_retention),
+            'pattern_sizes': np.array([len(x[1]) for x in pattern_keys], dtype=np.int64),
+            'pattern_dimensions': np.array([y for x in pattern_keys
+                                            for y in mask_to_dimensions(x[0])], dtype=np.int64),
+            'pattern_window_ids': np.array([y for x in pattern_keys for y in x[1]],
+                                           dtype=np.int64),
+            'retained_indexes': np.array(retained_indexes, dtype=np.int64),
+            'retained_lengths': np.array([len(x) for x in retained_occurences],
+                                         dtype=np.int64),
+            'retained_occurences': np.concatenate(
+                [np.empty(0, dtype=np.int64)] + retained_occurences).astype(np.int64),
+            'ranked_heap_values': np.array([x[0] for x in self._ranked_heap], dtype=np.float64),
+            'ranked_heap_indexes': np.array([-x[1] for x in self._ranked_heap],
+                                            dtype=np.int64)}
+
+        for name in metric_store_dtypes:
+            snapshot['metric_' + name] = self._metric_store.get_column(name)
+
+        return snapshot
+
+    @classmethod
+    def from_snapshot(cls, snapshot: dict) -> 'EnumeratedPattern':
+        """Summary
+            instance holding the patterns of a snapshot (see get_snapshot)
+        """
+        lag, num_of_readings = snapshot['config'].tolist()
+        occurence_retention = str(snapshot['occurence_retention'])
+        enum_pattern_inst = cls(snapshot['anomalous_windows'].tolist(), num_of_readings, lag,
+                                occurence_retention)
+        enum_pattern_inst.load_snapshot(snapshot)
 
-        self._fill_pattern_metrics()
+        return enum_pattern_inst
 
-        # Monitoring memory size of instance
-        self.num_of_patterns += 1
-        if self.num_of_patterns % patterns_alert_threshold == 0:
-            print_fun(self)
+    def load_snapshot(self, snapshot: dict) -> None:
+        """Summary
+            replaces enumerated patterns by those of a snapshot, taken with the same
+        configuration (lag, readings, anomalous windows and occurence retention)
+        """
+        if (snapshot['config'].tolist() != [self._lag, self._num_of_readings] or
+                str(snapshot['occurence_retention']) != self._occurence_retention or
+                snapshot['anomalous_windows'].tolist() != list(self._anomalous_windows)):
+            raise Exception('Snapshot was taken with a different enumeration configuration')
+
+        self.reset()
+        # snapshots of older sessions hold int64 dimension bitmasks
+        if 'pattern_masks' in snapshot:
+            pattern_masks = snapshot['pattern_masks'].tolist()
+            pattern_sizes = [bin(x).count('1') for x in pattern_masks]
+        else:
+            pattern_sizes = snapshot['pattern_sizes'].tolist()
+            dimensions = iter(snapshot['pattern_dimensions'].tolist())
+            pattern_masks = [dimensions_to_mask([next(dimensions) for _ in range(x)])
+                             for x in pattern_sizes]
+
+        window_ids = iter(snapshot['pattern_window_ids'].tolist())
+        pattern_keys = [(x, tuple(next(window_ids) for _ in range(y)))
+                        for x, y in zip(pattern_masks, pattern_sizes)]
+
+        self.merge_patterns(
+            pattern_keys, {name: snapshot['metric_' + name] for name in metric_store_dtypes},
+            dict())
+
+        retained_occurences = np.split(snapshot['retained_occurences'],
+                                       np.cumsum(snapshot['retained_lengths'])[:-1])
+        for pattern_index, occurences in zip(snapshot['retained_indexes'].tolist(),
+                                             retained_occurences):
+            if self._occurence_retention == 'compressed':
+                occurences = _delta_encode(occurences)
+            self._add_occurences(pattern_index, occurences)
+
+        # heap order as saved (a valid heap), snapshots of older sessions have none
+        if 'ranked_heap_values' in snapshot:
+            self._ranked_heap = [(value, -index) for value, index in zip(
+                snapshot['ranked_heap_values'].tolist(),
+                snapshot['ranked_heap_indexes'].tolist())]
+
+    def merge_patterns(self, pattern_keys: list, columns: dict, occurences: dict) -> None:
+        """Summary
+            appends exported patterns not enumerated yet (in their exported order), with
+        their metrics and retained occurences
+        """
+        new_rows = list()
+        for row, pattern_key in enumerate(pattern_keys):
+            if pattern_key in self._patterns:
+                continue
+
+            self._patterns[pattern_key] = self.num_of_patterns + len(new_rows)
+            self._pattern_keys.append(pattern_key)
+            self._key_nbytes += _get_key_nbytes(pattern_key)
+            new_rows.append(row)
+
+        if len(new_rows) == 0:
+            return
+
+        self._metric_store.append_rows({name: values[new_rows]
+                                        for name, values in columns.items()})
 
-    def _fill_pattern_counts(self, pattern_occurences: list) -> None:
+        is_above_threshold = columns['above_some_threshold']
+        for pattern_index, row in enumerate(new_rows, self.num_of_patterns):
+            if row not in occurences:
+                continue
+
+            if self._occurence_retention == 'compressed':
+                self._add_occurences(pattern_index, occurences[row])
+            elif is_above_threshold[row]:
+                self._retain_occurences(pattern_index, occurences[row])
+
+        self._count_new_patterns(len(new_rows))
+
+    def set_retention_rank(self, metric: str, filter_type: str, k: int = -1,
+                           threshold: float = -1) -> None:
         """Summary
-            Fills all fields that are directly derivable for the pattern
+            output ranking (same arguments as get_pattern_indexes), deciding which
+        patterns keep their occurences under ranked retention
         """
-        self._occurences.append(pattern_occurences)
-        self._patterncount.append(len(pattern_occurences))
+        self._retention_rank = (metric, filter_type, k, threshold)
 
-    def _fill_pattern_joinsets(self, pattern_occurences: list) -> None:
+    def _retain_occurences(self, pattern_index: int, occurences: np.ndarray) -> None:
         """Summary
-            Fill joinset cardinalities of pattern occurence w.r.t anomalous windows
+            keeps occurences (sorted start offsets) of a pattern, depending upon the
+        retention type. Under ranked retention, the pattern must be above threshold
         """
-        joinset_count = 0
-        unique_joinset_count = 0
+        if self._occurence_retention == 'compressed':
+            self._add_occurences(pattern_index, _delta_encode(occurences))
+            return
 
-        # Finds cooccurences of pattern and anomalous windows
-        for index in pattern_occurences:
-            temp_list = list(range(index, index + self._lag + 1))
-            start_windows = self._get_short_anomalous_windows(
-                index)
-            end_windows = self._get_short_anomalous_windows(
-                index + self._lag + 1)
-            shorter_anomalous_windows = list(set(start_windows + end_windows))
+        if self._retention_rank is None:
+            raise Exception('Output ranking not set for ranked occurence retention')
 
-            # getting intersections for join cardinality counts
-            num_of_intersections = len(
-                set(temp_list).intersection(shorter_anomalous_windows))
+        metric, filter_type, k, threshold = self._retention_rank
+        metric_value = self._get_metric_values(metric)[pattern_index]
 
-            if num_of_intersections > 0:
-                joinset_count += num_of_intersections
-                unique_joinset_count += 1
+        if filter_type == 'threshold':
+            if metric_value >= threshold:
+                self._add_occurences(pattern_index, occurences)
+            return
 
-        self._joinset_cardinality.append(joinset_count)
-        self._unique_joinset_cardinality.append(unique_joinset_count)
+        # topk: min heap of the k best (metric desc, index asc) retained patterns
+        heapq.heappush(self._ranked_heap, (metric_value, -pattern_index))
+        self._add_occurences(pattern_index, occurences)
+        if k != -1 and len(self._ranked_heap) > k:
+            self._remove_occurences(-heapq.heappop(self._ranked_heap)[1])
 
-    def _fill_pattern_metrics(self) -> None:
+    def _rank_flagged_patterns(self, pattern_indexes: np.ndarray,
+                               bool_results: np.ndarray) -> None:
         """Summary
-            Calculates various metrics for the patterns, like support, confidence, crossk
+            ranked retention of patterns just flagged: patterns above threshold are
+        ranked once (with the occurences held since enumeration), patterns below
+        threshold lose their occurences and ranking
         """
-        # Picking up last element
-        patterncount = self._patterncount[-1]
-        joinset_count = self._joinset_cardinality[-1]
-        unique_joinset_count = self._unique_joinset_cardinality[-1]
+        for pattern_index, bool_result in zip(pattern_indexes.tolist(), bool_results.tolist()):
+            if not bool_result:
+                self._unranked_indexes.discard(pattern_index)
+                self._unrank_pattern(pattern_index)
+                self._remove_occurences(pattern_index)
+
+            elif pattern_index in self._unranked_indexes:
+                self._unranked_indexes.remove(pattern_index)
+                occurences = self._occurences[pattern_index]
+                self._remove_occurences(pattern_index)
+                self._retain_occurences(pattern_index, occurences)
+
+    def _unrank_pattern(self, pattern_index: int) -> None:
+        """Summary
+            removes a pattern from the top-k retention heap, if ranked there
+        """
+        for position, (_, negated_index) in enumerate(self._ranked_heap):
+            if negated_index == -pattern_index:
+                self._ranked_heap[position] = self._ranked_heap[-1]
+                self._ranked_heap.pop()
+                heapq.heapify(self._ranked_heap)
+                return
+
+    def _add_occurences(self, pattern_index: int, occurences: np.ndarray) -> None:
+        self._occurences[pattern_index] = occurences
+        self._occurence_nbytes += occurences.nbytes
+
+    def _remove_occurences(self, pattern_index: int) -> None:
+        occurences = self._occurences.pop(pattern_index, None)
+        if occurences is not None:
+            self._occurence_nbytes -= occurences.nbytes
+
+    def get_pattern_occurences(self, pattern_index: int):
+        """Summary
+            returns all occurences (sorted start offsets) of a pattern, None when not
+        retained
+        """
+        occurences = self._occurences.get(pattern_index)
+        if occurences is None or self._occurence_retention != 'compressed':
+            return occurences
 
-        self._confidence.append(unique_joinset_count / patterncount)
-        self._support.append(joinset_count / self._num_of_readings)
+        return _delta_decode(occurences)
 
-        crossk_var = joinset_count / patterncount
-        self._crossk.append(self._crossk_const * crossk_var)
+    def _count_pattern_joinsets(self, patterns_occurences: list) -> tuple:
+        """Summary
+            Joinset cardinalities of pattern occurences w.r.t anomalous windows, for a
+        batch of patterns: one gather over all occurences, summed per pattern through
+        prefix sums at pattern boundaries
+        """
+        occurence_indexes = [x.get_indexes() for x in patterns_occurences]
+        boundaries = np.zeros(len(occurence_indexes) + 1, dtype=np.int64)
+        np.cumsum([len(x) for x in occurence_indexes], out=boundaries[1:])
+
+        occurence_anomaly_counts = self._window_anomaly_counts[
+            np.concatenate(occurence_indexes).astype(np.int64)]
+
+        joinset_sums = np.zeros(len(occurence_anomaly_counts) + 1, dtype=np.int64)
+        np.cumsum(occurence_anomaly_counts, out=joinset_sums[1:])
+        unique_joinset_sums = np.zeros(len(occurence_anomaly_counts) + 1, dtype=np.int64)
+        np.cumsum(occurence_anomaly_counts > 0, out=unique_joinset_sums[1:])
 
-    def _get_metric_values(self, metric: str) -> list:
+        return (np.diff(joinset_sums[boundaries]), np.diff(unique_joinset_sums[boundaries]))
+
+    def get_pattern_values(self, column: str) -> np.ndarray:
         """Summary
-            returns metric values depending upon the metric selected
+            returns a column of the metric store (row per enumerated pattern)
         """
-        metric_values = list()
+        return self._metric_store.get_column(column)
 
-        if metric == 'crossk':
-            metric_values = self._crossk
-        elif metric == 'confidence':
-            metric_values = self._confidence
-        elif metric == 'support':
-            metric_values = self._support
-        else:
+    def _get_metric_values(self, metric: str) -> np.ndarray:
+        """Summary
+            returns metric values depending upon the metric selected
+        """
+        if metric not in metric_names:
             raise Exception('Invalid metric type provided')
 
-        return metric_values
+        return self._metric_store.get_column(metric)
 
     def is_above_threshold(self, pattern_index: int, threshold_metric: str,
                            threshold_value: float) -> bool:
         """Summary
-            returns pattern at a specific index to be above threshold or not
+            returns pattern at a specific index (negative indexes count from the last
+        enumerated pattern) to be above threshold or not
         """
+        if pattern_index < 0:
+            pattern_index += self.num_of_patterns
+
+        return bool(self.are_above_threshold([pattern_index], threshold_metric,
+                                             threshold_value)[0])
+
+    def are_above_threshold(self, pattern_indexes: list, threshold_metric: str,
+                            threshold_value: float) -> np.ndarray:
+        """Summary
+            is_above_threshold for a batch of pattern indexes
+        """
+        pattern_indexes = np.asarray(pattern_indexes, dtype=np.int64)
         metric_values = self._get_metric_values(threshold_metric)
-        bool_result = metric_values[pattern_index] >= threshold_value
+        bool_results = metric_values[pattern_indexes] >= threshold_value
 
         # Set for records of the pattern
-        self._above_some_threshold[pattern_index] = bool_result
+        self._metric_store.get_column('above_some_threshold')[pattern_indexes] = bool_results
+        if self._occurence_retention == 'ranked':
+            self._rank_flagged_patterns(pattern_indexes, bool_results)
 
-        return bool_result
+        return bool_results
 
-    def find_pattern(self, pattern_str: str) -> int:
+    def find_pattern(self, pattern_key: tuple) -> int:
         """Summary
             returns index of enumerated pattern
         """
-        if pattern_str in self._patterns:
-            # return self._patterns.index(pattern_str)
-            return self._patterns[pattern_str]
-
-        return -1
+        return self._patterns.get(pattern_key, -1)
 
     def get_pattern_indexes(self, metric: str, filter_type: str, k: int = -1,
-                            threshold: float = -1) -> list:
+                            threshold: float = -1, pattern_filter: np.ndarray = None) -> list:
         """Summary
             returns indexes of topK patterns or patterns above a threshold, depending upon metric
+        pattern_filter: optional boolean array, restricting the patterns considered
         """
-        pattern_indexes = list()
-
         metric_values = self._get_metric_values(metric)
-        num_of_patterns = len(metric_values)
 
         # Get only valid indexes
-        indexes_above_threshold = [x for x in range(
-            num_of_patterns) if self._above_some_threshold[x]]
+        is_valid_pattern = self._metric_store.get_column('above_some_threshold')
+        if pattern_filter is not None:
+            is_valid_pattern = is_valid_pattern & pattern_filter
+        indexes_above_threshold = np.flatnonzero(is_valid_pattern)
 
         if filter_type == 'topk' and k != -1:
-            pattern_indexes = sorted(
-                indexes_above_threshold, key=lambda i: metric_values[i], reverse=True)[:k]
+            pattern_indexes = _get_topk_indexes(
+                metric_values[indexes_above_threshold], indexes_above_threshold, k)
 
         elif filter_type == 'threshold' and threshold != -1:
-            pattern_indexes = [i for i in indexes_above_threshold
-                               if metric_values[i] >= threshold]
+            pattern_indexes = indexes_above_threshold[
+                metric_values[indexes_above_threshold] >= threshold]
         else:
             raise Exception(
                 'Insufficient / wrong parameters for finding pattern indexes')
 
-        return pattern_indexes
+        return pattern_indexes.tolist()
+
+    def get_support_floors(self) -> np.ndarray:
+        """Summary
+            minimum support over each pattern and all of its sub-patterns. Apriori (support
+        pruning) enumerates a pattern flagged above a support threshold iff its floor is
+        above the threshold, so one run at the loosest threshold serves all tighter ones
+        """
+        pattern_keys = self._pattern_keys
+        support_floors = self.get_pattern_values('support').copy()
+
+        # sub-patterns (one dimension less) before patterns
+        for pattern_index in sorted(range(self.num_of_patterns),
+                                    key=lambda i: bin(pattern_keys[i][0]).count('1')):
+            mask, window_ids = pattern_keys[pattern_index]
+            dimensions = mask_to_dimensions(mask)
+            if len(dimensions) == 1:
+                continue
+
+            for position, dim in enumerate(dimensions):
+                subpattern_index = self.find_pattern(
+                    (mask ^ (1 << dim), window_ids[:position] + window_ids[position + 1:]))
+                if subpattern_index == -1:
+                    raise Exception('Sub-pattern not enumerated, support floors need apriori')
+
+                support_floors[pattern_index] = min(support_floors[pattern_index],
+                                                    support_floors[subpattern_index])
+
+        return support_floors
 
     def get_patterns(self, pattern_indexes: list) -> list:
         """Summary
-            returns list of patterns as strings, through list of indexes provided
+            returns list of pattern keys, through list of indexes provided
+        """
+        return [self._pattern_keys[i] for i in pattern_indexes]
+
+    def get_pattern_window_ids(self, pattern_indexes: list, num_of_dims: int) -> np.ndarray:
+        """Summary
+            window id of every pattern (row) in every dimension (column), -1 for dimensions
+        not in the pattern
         """
-        return np.array(list(self._patterns.keys()))[pattern_indexes].tolist()
+        pattern_keys = self.get_patterns(pattern_indexes)
+        key_window_ids = np.array([y for x in pattern_keys for y in x[1]], dtype=np.int64)
+
+        # dimensions decoded from the (python int) masks, in the order of key window ids
+        key_dimensions = [mask_to_dimensions(x[0]) for x in pattern_keys]
+        key_rows = np.repeat(np.arange(len(pattern_keys)),
+                             [len(x) for x in key_dimensions]).astype(np.int64)
+        key_columns = np.array([y for x in key_dimensions for y in x], dtype=np.int64)
+
+        pattern_window_ids = np.full((len(pattern_keys), num_of_dims), -1, dtype=np.int64)
+        pattern_window_ids[key_rows, key_columns] = key_window_ids
+
+        return pattern_window_ids
 
     def get_pattern_metrics(self, pattern_indexes: list) -> pd.DataFrame:
         """Summary
             Provided list of pattern indexes, returns five defined metrics of patterns
         in a structure format (only returning index of the first occurence)
         """
-        # manual indexing due to length of pattern occurences being irregular
-        pattern_occurences = [x[0] for x in
-                              np.array(self._occurences, dtype=object)[pattern_indexes]]
-        return pd.DataFrame({metric_col_names[0]: np.array(self._patterncount)[pattern_indexes],
-                             metric_col_names[1]: np.array(self._support)[pattern_indexes],
-                             metric_col_names[2]: np.array(self._crossk)[pattern_indexes],
-                             metric_col_names[3]: np.array(self._confidence)[pattern_indexes],
-                             metric_col_names[4]: pattern_occurences})
+        pattern_indexes = np.asarray(pattern_indexes, dtype=np.int64)
+        return pd.DataFrame({
+            metric_col_names[0]: self.get_pattern_values('patterncount')[pattern_indexes],
+            metric_col_names[1]: self.get_pattern_values('support')[pattern_indexes],
+            metric_col_names[2]: self.get_pattern_values('crossk')[pattern_indexes],
+            metric_col_names[3]: self.get_pattern_values('confidence')[pattern_indexes],
+            metric_col_names[4]: self.get_pattern_values('first_occurence')[pattern_indexes]})
 
     def __str__(self):
-        size_of_patterns = sys.getsizeof(self._patterns) / 1000000
+        size_of_patterns = (sys.getsizeof(self._patterns) + sys.getsizeof(self._pattern_keys) +
+                            self._key_nbytes + self._metric_store.get_nbytes() +
+                            self._occurence_nbytes + self._window_anomaly_counts.nbytes) / 1000000
         desc = 'Number of patterns enumerated: {0} | Memory size: {1} MB'
 
         return desc.format(self.num_of_patterns, size_of_patterns)
+
+
+def _get_topk_indexes(values: np.ndarray, indexes: np.ndarray, k: int) -> np.ndarray:
+    """Summary
+        indexes of the k largest values, by value descending then index ascending (as a
+    stable sort on negated values, nan last). A partition finds the k-th largest value,
+    only the (at most k) selected patterns are sorted
+    """
+    if k <= 0:
+        return indexes[:0]
+
+    is_nan = np.isnan(values)
+    if is_nan.any():
+        nan_indexes = indexes[is_nan]
+        topk_indexes = _get_topk_indexes(values[~is_nan], indexes[~is_nan], k)
+        return np.concatenate([topk_indexes, nan_indexes[:k - len(topk_indexes)]])
+
+    if k < len(values):
+        kth_value = -np.partition(-values, k - 1)[k - 1]
+
+        # every value above the k-th, and the first (by index) of those tied with it
+        is_above = values > kth_value
+        tied_positions = np.flatnonzero(values == kth_value)[:k - np.count_nonzero(is_above)]
+        is_above[tied_positions] = True
+        values, indexes = values[is_above], indexes[is_above]
+
+    order = np.lexsort((indexes, -values))
+    return indexes[order]
+
+
+def _get_key_nbytes(pattern_key) -> int:
+    """Summary
+        approximate bytes of a pattern key (and of the tuples within it)
+    """
+    if isinstance(pattern_key, tuple):
+        return sys.getsizeof(pattern_key) + sum(_get_key_nbytes(x) for x in pattern_key)
+
+    return sys.getsizeof(pattern_key)
+
+
+def _delta_encode(indexes: np.ndarray) -> np.ndarray:
+    """Summary
+        gaps between sorted occurences, in the smallest unsigned type holding them
+    """
+    deltas = np.diff(indexes, prepend=0)
+    if len(deltas) == 0:
+        return deltas.astype(np.uint8)
+
+    return deltas.astype(np.min_scalar_type(int(deltas.max())))
+
+
+def _delta_decode(deltas: np.ndarray) -> np.ndarray:
+    return np.cumsum(deltas, dtype=np.int64)
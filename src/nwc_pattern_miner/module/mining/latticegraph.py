@@ -87,41 +87,43 @@ class LatticeGraph:
         return self._nodes_by_level
 
     def prune_nodes_recursively(self, depth: int, dimension: tuple,
-                                prune_type: str, num_of_pruned_nodes: int = 0) -> int:
+                                prune_type: str) -> int:
         """Summary
-            prunes nodes recursively both sides either parents or children
+            prunes nodes both sides either parents or children, returns the exact
+        number of nodes newly pruned (iterative DFS, no recursion limit)
         Args:
             depth (int): depth at which node is located
             dimension (tuple): dimensions of the node
             prune_type (str): Parents or children
         """
-        lattice_node_inst = self.get_node(depth, dimension)
-
-        if lattice_node_inst.is_node_pruned():
-            return num_of_pruned_nodes
-
-        # Else we prune the node and move forward
-        lattice_node_inst.prune_node()
-        num_of_pruned_nodes += 1
-
         # deciding where to on the basis of prune type
-        next_depth = 0
-        next_level_nodes = list()
         if prune_type == prune_types[0]:
-            next_depth = depth - 1
-            next_level_nodes = lattice_node_inst.get_parents()
-
+            depth_step = -1
         elif prune_type == prune_types[1]:
-            next_depth = depth + 1
-            next_level_nodes = lattice_node_inst.get_children()
-
+            depth_step = 1
         else:
             raise Exception('Wrong prune type provided')
 
-        # Using DFS for the task
-        for next_level_dimension in next_level_nodes:
-            num_of_pruned_nodes += self.prune_nodes_recursively(
-                next_depth, next_level_dimension, prune_type, num_of_pruned_nodes)
+        num_of_pruned_nodes = 0
+        nodes_to_prune = [(depth, dimension)]
+        while nodes_to_prune:
+            depth, dimension = nodes_to_prune.pop()
+            lattice_node_inst = self.get_node(depth, dimension)
+
+            if lattice_node_inst.is_node_pruned():
+                continue
+
+            # Else we prune the node and move forward
+            lattice_node_inst.prune_node()
+            num_of_pruned_nodes += 1
+
+            if depth_step == -1:
+                next_level_nodes = lattice_node_inst.get_parents()
+            else:
+                next_level_nodes = lattice_node_inst.get_children()
+
+            nodes_to_prune.extend((depth + depth_step, next_level_dimension)
+                                  for next_level_dimension in next_level_nodes)
 
         return num_of_pruned_nodes
 
@@ -0,0 +1,149 @@
+# Lattice of subsets generated level by level, for high dimensional data
+# Nodes are dimension bitmasks (same interface as BitmaskLattice), but a level is only
+# materialized on request: Apriori join of the surviving level below when it is known,
+# otherwise combinations of dimensions whose singletons survived
+import itertools
+
+from ..utilities import mask_to_dimensions
+
+# File specific constants
+prune_types = ['parents', 'children']
+
+
+class LazyLattice:
+
+    def __init__(self, num_of_dim: int):
+        self._num_of_dim = num_of_dim
+        self.num_of_nodes = 2 ** num_of_dim - 1
+        self.reset()
+
+    def reset(self) -> None:
+        """Summary
+            clears pruning state, generated levels and superpattern counts, for a new window
+        levels: {size: masks handed out for that size}
+        pruned_masks: materialized nodes pruned
+        pruned_up / pruned_down: nodes whose supersets / subsets are pruned
+        """
+        self._levels = dict()
+        self._pruned_masks = set()
+        self._pruned_up = list()
+        self._pruned_down = list()
+        self._superpattern_count = dict()
+
+    def _is_covered(self, mask: int) -> bool:
+        """Summary
+            if node lies above / below any node pruned with its parents / children
+        """
+        return (any(mask & x == x for x in self._pruned_up) or
+                any(x & mask == mask for x in self._pruned_down))
+
+    def _get_surviving_masks(self, size: int) -> list:
+        return [x for x in self._levels[size] if x not in self._pruned_masks]
+
+    def _join_level(self, size: int) -> list:
+        """Summary
+            Apriori join: candidates whose every subset (one dimension less) survived
+        """
+        survivors = self._get_surviving_masks(size - 1)
+        survivors_set = set(survivors)
+
+        # Grouping survivors by all but their highest dimension
+        survivors_by_prefix = dict()
+        for mask in survivors:
+            highest_bit = 1 << (mask.bit_length() - 1)
+            survivors_by_prefix.setdefault(mask ^ highest_bit, list()).append(highest_bit)
+
+        candidates = list()
+        for prefix, highest_bits in survivors_by_prefix.items():
+            for bit_a, bit_b in itertools.combinations(highest_bits, 2):
+                mask = prefix | bit_a | bit_b
+                if all(mask ^ (1 << dim) in survivors_set
+                       for dim in mask_to_dimensions(mask)):
+                    candidates.append(mask)
+
+        return candidates
+
+    def _combine_level(self, size: int) -> list:
+        """Summary
+            combinations of dimensions whose singleton survived (all, before singletons)
+        """
+        if 1 in self._levels:
+            dimensions = [x.bit_length() - 1 for x in self._get_surviving_masks(1)]
+        else:
+            dimensions = list(range(self._num_of_dim))
+
+        candidates = list()
+        for node_dimensions in itertools.combinations(dimensions, size):
+            mask = sum(1 << dim for dim in node_dimensions)
+            if not self._is_covered(mask):
+                candidates.append(mask)
+
+        return candidates
+
+    def get_level(self, depth: int) -> list:
+        """Summary
+            returns node masks at a depth (depth 0 is the root), ascending like BitmaskLattice
+        """
+        size = self._num_of_dim - depth
+        if size == 1:
+            candidates = [1 << dim for dim in range(self._num_of_dim)
+                          if not self._is_covered(1 << dim)]
+        elif size - 1 in self._levels:
+            candidates = self._join_level(size)
+        else:
+            candidates = self._combine_level(size)
+
+        self._levels[size] = sorted(candidates)
+        return self._levels[size]
+
+    def get_dimensions(self, mask: int) -> tuple:
+        return mask_to_dimensions(mask)
+
+    def is_node_pruned(self, mask: int) -> bool:
+        return mask in self._pruned_masks
+
+    def prune_node(self, mask: int) -> None:
+        self._pruned_masks.add(mask)
+
+    def get_superpattern_count(self, mask: int) -> int:
+        return self._superpattern_count.get(mask, -1)
+
+    def set_superpattern_count(self, mask: int, count: int) -> None:
+        self._superpattern_count[mask] = count
+
+    def get_parents(self, mask: int) -> list:
+        """Summary
+            supersets with one more dimension (a bit set)
+        """
+        return [mask | (1 << dim) for dim in range(self._num_of_dim) if not mask & (1 << dim)]
+
+    def get_children(self, mask: int) -> list:
+        """Summary
+            subsets with one less dimension (a bit cleared), singletons have no children
+        """
+        if mask & (mask - 1) == 0:
+            return list()
+
+        return [mask ^ (1 << dim) for dim in mask_to_dimensions(mask)]
+
+    def prune_nodes(self, mask: int, prune_type: str) -> int:
+        """Summary
+            prunes node and either all of its supersets (parents) or subsets (children).
+        Supersets / subsets are never materialized afterwards, so the count returned is
+        of materialized nodes newly pruned
+        Args:
+            mask (int): bitmask of the node
+            prune_type (str): Parents or children
+        """
+        if prune_type == prune_types[0]:
+            self._pruned_up.append(mask)
+        elif prune_type == prune_types[1]:
+            self._pruned_down.append(mask)
+        else:
+            raise Exception('Wrong prune type provided')
+
+        if mask in self._pruned_masks:
+            return 0
+
+        self._pruned_masks.add(mask)
+        return 1
@@ -0,0 +1,56 @@
+# Columnar store of per pattern values, typed numpy arrays grown by doubling
+import numpy as np
+
+# File specific constant
+initial_capacity = 1024
+
+
+class MetricStore:
+
+    def __init__(self, column_dtypes: dict) -> None:
+        """Summary
+            column_dtypes: {column name: numpy dtype}, one preallocated array per column
+        """
+        self._size = 0
+        self._capacity = initial_capacity
+        self._columns = {name: np.zeros(initial_capacity, dtype=dtype)
+                         for name, dtype in column_dtypes.items()}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _reserve(self, size: int) -> None:
+        """Summary
+            amortized doubling of every column, until size rows fit
+        """
+        if size <= self._capacity:
+            return
+
+        while self._capacity < size:
+            self._capacity *= 2
+
+        for name, values in self._columns.items():
+            grown_values = np.zeros(self._capacity, dtype=values.dtype)
+            grown_values[:self._size] = values[:self._size]
+            self._columns[name] = grown_values
+
+    def append_rows(self, columns: dict) -> None:
+        """Summary
+            appends equal length arrays (one per column) as new rows
+        """
+        num_of_rows = len(next(iter(columns.values())))
+        self._reserve(self._size + num_of_rows)
+
+        for name, values in columns.items():
+            self._columns[name][self._size: self._size + num_of_rows] = values
+
+        self._size += num_of_rows
+
+    def get_column(self, name: str) -> np.ndarray:
+        """Summary
+            view of the filled part of a column
+        """
+        return self._columns[name][:self._size]
+
+    def get_nbytes(self) -> int:
+        return sum(values.nbytes for values in self._columns.values())
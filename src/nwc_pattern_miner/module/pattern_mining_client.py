@@ -1,22 +1,30 @@
 """Summary
 API end point to read input, delegate mining by creating strategies, and finally
-formats patterns identified in a specific format
+formats patterns identified in a specific format (again for every query of a session)
 """
+import os
+import json
+import numpy as np
 import pandas as pd
 
-from .utilities import print_fun
+from .utilities import print_fun, mask_to_dimensions, SegmentBoundaries
 from .pruning import SupportPruning, UBPruning
 from .mining import EnumeratedPattern
-from .patterncount import SequenceMap
+from .patterncount import SequenceMap, PatternCountStrategy
 from .patternminer import PatternMiner
 
 # Specific constants
-dummy_col_name = 'dummy'
-dummy_col_value = 'na'
 ub_pruning = 'bi-dr'
 supp_pruning = 'apriori'
 support_output_metrics = ['crossk', 'support']
 supported_output_types = ['threshold', 'topk']
+# arrays of a mining session snapshot, other than those of the enumerated patterns
+snapshot_col_names = 'col_names'
+snapshot_pattern_length = 'pattern_length'
+snapshot_window_values = 'window_values_{0}'
+snapshot_mining_stats = 'mining_stats'
+# mining checkpoint of a target column and pattern length
+checkpoint_file_name = 'checkpoint_{0}_{1}.npz'
 
 
 def mine_sequence_patterns(series_df: pd.DataFrame, nc_window_col: str,
@@ -26,112 +34,441 @@ def mine_sequence_patterns(series_df: pd.DataFrame, nc_window_col: str,
                            output_metric: str = 'crossk',
                            output_type: str = 'topk',
                            output_threshold: float = -1, topk: int = 100,
-                           pruning_type: str = 'apriori') -> pd.DataFrame:
+                           pruning_type: str = 'apriori',
+                           lazy_lattice: bool = False,
+                           occurence_retention: str = 'first',
+                           n_jobs: int = 1,
+                           count_within_segments: bool = False,
+                           cache_dir: str = None,
+                           return_session: bool = False,
+                           output_codes: bool = False,
+                           dynamic_crossk: bool = False,
+                           time_budget: float = None,
+                           max_enumerations: int = None,
+                           cancel_token=None,
+                           window_order: str = 'data',
+                           checkpoint_dir: str = None,
+                           resume: bool = False) -> pd.DataFrame:
     """Summary
         Main function / interface for the package (Driver function)
+    Args:
+        nc_window_col (str or list): a list of target columns is mined with one sequence
+    index of the features (columns that are not targets), returning a dict of outputs by
+    target column (and of sessions, with return_session). Only the index is shared: which
+    patterns are enumerated and pruned depends on each target's anomalous windows (through
+    support and crossk), so every target is enumerated, pruned and counted on its own
+        pattern_length (int or list): a list (or range) of pattern lengths is mined with
+    one sequence index, extended from each length to the next. Results are stacked, keyed
+    by the pattern length (sessions are returned in a dict by pattern length)
+        count_within_segments (bool, optional): occurences and joinsets never cross
+    invalid_seq_indexes either (by default only mined windows do not)
+        cache_dir (str, optional): directory caching the sequence index across calls
+        return_session (bool, optional): also return a MiningSession, answering other
+    output queries without mining again
+        output_codes (bool, optional): attributes of patterns as window ids, see
+    format_output
+        dynamic_crossk (bool, optional): for bi-dr pruning with a topk output by crossk,
+    UB pruning uses the k-th best crossk mined so far as its crossk threshold (when above
+    crossk_threshold), same top-k with fewer enumerations
+        time_budget (float, optional): seconds of mining (per pattern length and target),
+    after which mining stops and returns the patterns found so far
+        max_enumerations (int, optional): stops mining after these many patterns
+        cancel_token (optional): stops mining once its is_set() returns True
+        window_order (str, optional): 'data' or 'density' (densest anomaly clusters mined
+    first). Output frames (and sessions) carry mining_stats, with is_partial and coverage
+        checkpoint_dir (str, optional): directory of mining checkpoints (per target and
+    pattern length), saved periodically
+        resume (bool, optional): continues mining from checkpoints in checkpoint_dir,
+    if any, with output identical to an uninterrupted run
     """
     # Creating concrete strategy for counting patterns
     message = 'Counting pattern occurences'
     print_fun(message, status='step')
-    seqmap_inst = SequenceMap(series_df, nc_window_col)
-    seqmap_inst.init_seq_map(pattern_length)
+    if n_jobs == -1:
+        n_jobs = os.cpu_count()
 
-    # Instantiating instance for pattern enumeration
     num_of_readings = len(series_df)
+    segment_boundaries = SegmentBoundaries(invalid_seq_indexes, num_of_readings)
+    count_boundaries = segment_boundaries if count_within_segments else None
+
+    pattern_lengths = [pattern_length] if np.isscalar(pattern_length) else sorted(
+        set(pattern_length))
+    nc_window_cols = [nc_window_col] if isinstance(nc_window_col, str) else list(
+        nc_window_col)
+
+    # Features are indexed once, for every target column
+    seqmap_inst = SequenceMap(series_df.drop(columns=nc_window_cols[1:]), nc_window_cols[0],
+                              count_boundaries)
+    seqmap_inst.init_seq_map(pattern_lengths[0], n_jobs, cache_dir, pattern_lengths[-1])
+
+    patterns_mined = {target_col: dict() for target_col in nc_window_cols}
+    for length in pattern_lengths:
+        seqmap_inst.extend_seq_map(length, n_jobs)
+        # enumeration and pruning depend on the target's anomalies, mined per target
+        for target_col in nc_window_cols:
+            target_df = series_df.drop(columns=[x for x in nc_window_cols if x != target_col])
+            patterns_mined[target_col][length] = _mine_indexed_patterns(
+                target_df, target_col, seqmap_inst, segment_boundaries, count_boundaries,
+                support_threshold, crossk_threshold, length, lag, output_metric,
+                output_type, output_threshold, topk, pruning_type, lazy_lattice,
+                occurence_retention, n_jobs, output_codes, dynamic_crossk,
+                dict(time_budget=time_budget, max_enumerations=max_enumerations,
+                     cancel_token=cancel_token, window_order=window_order,
+                     checkpoint_path=None if checkpoint_dir is None else os.path.join(
+                         checkpoint_dir, checkpoint_file_name.format(target_col, length))),
+                resume)
+
+    target_outputs = {target_col: _stack_pattern_lengths(patterns_mined[target_col],
+                                                         pattern_length)
+                      for target_col in nc_window_cols}
+    if isinstance(nc_window_col, str):
+        patterns_mined_df, sessions = target_outputs[nc_window_col]
+    else:
+        patterns_mined_df = {x: output[0] for x, output in target_outputs.items()}
+        sessions = {x: output[1] for x, output in target_outputs.items()}
+
+    return (patterns_mined_df, sessions) if return_session else patterns_mined_df
+
+
+def _stack_pattern_lengths(patterns_mined: dict, pattern_length) -> tuple:
+    """Summary
+        output dataframe and session of a single pattern length, or dataframes stacked
+    by pattern length (and sessions in a dict by pattern length) for a list of lengths
+    """
+    if np.isscalar(pattern_length):
+        return patterns_mined[pattern_length]
+
+    # every requested length is in the level index, lengths without patterns have no rows
+    pattern_lengths = list(patterns_mined.keys())
+    patterns_mined_df = pd.concat([patterns_mined[x][0] for x in pattern_lengths],
+                                  keys=pattern_lengths, levels=[pattern_lengths],
+                                  names=['pattern_length', None])
+
+    return patterns_mined_df, {length: session for length, (
+        _, session) in patterns_mined.items()}
+
+
+def _mine_indexed_patterns(series_df: pd.DataFrame, nc_window_col: str,
+                           seqmap_inst: SequenceMap, segment_boundaries: SegmentBoundaries,
+                           count_boundaries: SegmentBoundaries, support_threshold: float,
+                           crossk_threshold: float, pattern_length: int, lag: int,
+                           output_metric: str, output_type: str, output_threshold: float,
+                           topk: int, pruning_type: str, lazy_lattice: bool,
+                           occurence_retention: str, n_jobs: int,
+                           output_codes: bool, dynamic_crossk: bool,
+                           miner_options: dict, resume: bool) -> tuple:
+    """Summary
+        Mines patterns of one length, with the sequence index built for that length.
+    Returns the output dataframe and a MiningSession
+        miner_options: budgets, cancellation, window order and checkpoint of PatternMiner
+        resume: resumes from the checkpoint, if saved
+    """
+    num_of_readings = len(series_df)
+
+    # Instantiating instance for pattern enumeration
     anomalous_windows = series_df.index[series_df[nc_window_col] == 1].tolist()
     enum_patterns_inst = EnumeratedPattern(
-        anomalous_windows, num_of_readings, lag)
+        anomalous_windows, num_of_readings, lag, occurence_retention, count_boundaries)
+    enum_patterns_inst.set_retention_rank(output_metric, output_type, topk, output_threshold)
 
     # Instantiate concrete strategy for pruning
     num_of_dims = series_df.shape[1] - 1
     if pruning_type == supp_pruning:
         pruning_inst = SupportPruning(
-            num_of_dims, series_df, enum_patterns_inst, seqmap_inst, support_threshold)
+            num_of_dims, series_df, enum_patterns_inst, seqmap_inst, support_threshold,
+            lazy_lattice)
     else:
+        is_crossk_topk = output_type == 'topk' and output_metric == 'crossk'
         pruning_inst = UBPruning(num_of_dims, series_df, enum_patterns_inst,
-                                 seqmap_inst, support_threshold, crossk_threshold)
+                                 seqmap_inst, support_threshold, crossk_threshold,
+                                 lazy_lattice, topk if dynamic_crossk and is_crossk_topk else -1)
 
     # Instantiate miner instance
     message = 'Processing Anomalous Windows'
     print_fun(message, status='step')
 
     patternminer_inst = PatternMiner(
-        pattern_length, num_of_dims, invalid_seq_indexes, enum_patterns_inst, pruning_inst)
-    patternminer_inst.mine()
+        pattern_length, num_of_dims, segment_boundaries, enum_patterns_inst, pruning_inst,
+        n_jobs, **miner_options)
+
+    checkpoint_path = miner_options['checkpoint_path']
+    if resume and checkpoint_path is not None and os.path.exists(checkpoint_path):
+        patternminer_inst.resume()
+    else:
+        patternminer_inst.mine()
+    mining_stats = patternminer_inst.get_mining_stats()
 
     # Preparing final output
     patterns_mined_df = pd.DataFrame()
     col_names = series_df.columns[series_df.columns != nc_window_col].tolist()
 
-    patterns_mined_df = format_output(col_names, enum_patterns_inst,
+    patterns_mined_df = format_output(col_names, enum_patterns_inst, seqmap_inst,
                                       pattern_length, output_metric, output_type,
-                                      k=topk, threshold=output_threshold)
+                                      k=topk, threshold=output_threshold,
+                                      output_codes=output_codes)
+    patterns_mined_df.attrs['mining_stats'] = mining_stats
+
+    window_values = [seqmap_inst.get_window_values(dim) for dim in range(num_of_dims)]
+    return patterns_mined_df, MiningSession(col_names, pattern_length, enum_patterns_inst,
+                                            window_values, mining_stats)
+
+
+def mine_multi_series_patterns(series, nc_window_col: str, support_threshold: float,
+                               crossk_threshold: float, pattern_length: int,
+                               group_col: str = None, **kwargs) -> pd.DataFrame:
+    """Summary
+        Mines patterns across many series (e.g. trips): windows, occurences and joinsets
+    never cross from one series into another, metrics are aggregated over all series.
+    First occurrence indexes refer to rows of the series stacked in order
+    Args:
+        series: list of dataframes (same columns), or one dataframe split by group_col
+        group_col (str, optional): column identifying the series of each row
+        kwargs: any other parameters of mine_sequence_patterns (except invalid_seq_indexes)
+    """
+    if 'invalid_seq_indexes' in kwargs:
+        raise Exception('Series boundaries replace invalid_seq_indexes, for multiple series')
+
+    if group_col is None:
+        series_lengths = [len(x) for x in series]
+        series_df = pd.concat(series, ignore_index=True)
+    else:
+        group_values = series[group_col]
+        is_new_series = (group_values != group_values.shift()).to_numpy()
+
+        # rows of a series are stacked together (stable), if not contiguous already
+        if is_new_series.sum() != group_values.nunique():
+            series = series.iloc[pd.factorize(group_values)[0].argsort(kind='stable')]
+
+        series_lengths = group_values.value_counts(sort=False).reindex(
+            series[group_col].unique()).tolist()
+        series_df = series.drop(columns=group_col).reset_index(drop=True)
+
+    # each series starts a new segment
+    series_starts = np.cumsum([0] + series_lengths[:-1])
+    is_series_start = np.zeros(len(series_df), dtype=bool)
+    is_series_start[series_starts[series_starts < len(series_df)]] = True
 
-    return patterns_mined_df
+    return mine_sequence_patterns(series_df, nc_window_col, support_threshold,
+                                  crossk_threshold, pattern_length,
+                                  invalid_seq_indexes=is_series_start,
+                                  count_within_segments=True, **kwargs)
+
+
+def mine_threshold_sweep(series_df: pd.DataFrame, nc_window_col: str,
+                         support_thresholds: list, crossk_thresholds: list,
+                         pattern_length: int, output_metric: str = 'crossk',
+                         output_type: str = 'topk', output_threshold: float = -1,
+                         topk: int = 100, **kwargs) -> pd.DataFrame:
+    """Summary
+        Mines once (apriori) at the loosest support threshold, then derives the output of
+    every (support, crossk) threshold pair. The patterns of a pair are those apriori
+    mining enumerates (and flags) at that support threshold, restricted to patterns with
+    crossk at or above the crossk threshold, and the output is taken over them (top-k of
+    the restricted patterns, for a topk output). Apriori mining does not use the crossk
+    threshold, so a pair's result is not the output of mine_sequence_patterns at that
+    pair, but that output filtered by crossk (exactly so for a threshold output).
+    Results are stacked, keyed by the threshold pair
+    Args:
+        kwargs: any other parameters of mine_sequence_patterns, for one target column
+    """
+    if kwargs.get('pruning_type', supp_pruning) != supp_pruning:
+        raise Exception('Threshold sweep is only supported with apriori pruning')
+
+    if not isinstance(nc_window_col, str) or not np.isscalar(pattern_length):
+        raise ValueError('Threshold sweep mines a single target column and pattern length')
+
+    _, session = mine_sequence_patterns(
+        series_df, nc_window_col, min(support_thresholds), min(crossk_thresholds),
+        pattern_length, output_metric=output_metric, output_type=output_type,
+        output_threshold=output_threshold, topk=topk, return_session=True, **kwargs)
+
+    enum_patterns_inst = session.get_enum_pattern_inst()
+    support_floors = enum_patterns_inst.get_support_floors()
+    crossk_values = enum_patterns_inst.get_pattern_values('crossk')
+
+    sweep_results = dict()
+    for support_threshold in support_thresholds:
+        for crossk_threshold in crossk_thresholds:
+            pattern_filter = ((support_floors >= support_threshold) &
+                              (crossk_values >= crossk_threshold))
+            sweep_results[(support_threshold, crossk_threshold)] = session.query(
+                output_metric, output_type, topk, output_threshold, pattern_filter,
+                kwargs.get('output_codes', False))
+
+    return pd.concat(sweep_results, names=['support_threshold', 'crossk_threshold', None])
 
 
 def format_output(col_names: list, enum_pattern_inst: EnumeratedPattern,
+                  pattern_count_inst: PatternCountStrategy,
                   pattern_length: int, metric: str, filter_type: str, k: int = -1,
-                  threshold: float = -1) -> pd.DataFrame:
+                  threshold: float = -1, pattern_filter: np.ndarray = None,
+                  output_codes: bool = False) -> pd.DataFrame:
     """Summary
         Retuns patterns and associated metrics as a dataframe
     Args:
+        pattern_count_inst (PatternCountStrategy): to reconstruct patterns from their keys
+    (or a MiningSession)
         pattern_length (int): Fixed pattern length
         metric (str): Type of metric to filter patterns upon
         filter_type (str): filter_type of filter (topk vs threshold based)
         k (int, optional): K if filter_type=topk
         threshold (float, optional): threshold value if filter_type=threshold
+        pattern_filter (np.ndarray, optional): boolean array, patterns to consider
+        output_codes (bool, optional): attributes as window ids (-1 if not in the pattern)
+    instead of values joined by spaces, see get_window_values for the values of an id
     """
     message = 'Formatting Enumerated Patterns ({0}) as Output via: ({1})'.format(
         enum_pattern_inst.num_of_patterns, filter_type)
     print_fun(message, status='step')
 
     pattern_indexes = enum_pattern_inst.get_pattern_indexes(
-        metric, filter_type, k, threshold)
+        metric, filter_type, k, threshold, pattern_filter)
 
-    patterns_list = enum_pattern_inst.get_patterns(pattern_indexes)
+    # Only patterns being returned are rendered, a column at a time
+    num_of_dims = len(col_names)
+    pattern_window_ids = enum_pattern_inst.get_pattern_window_ids(pattern_indexes, num_of_dims)
+    window_values = [pattern_count_inst.get_window_values(dim) for dim in range(num_of_dims)]
     pattern_metrics = enum_pattern_inst.get_pattern_metrics(pattern_indexes)
 
     all_patterns_df = convert_patterns_to_df(
-        patterns_list, col_names, pattern_length)
+        pattern_window_ids, window_values, col_names, pattern_length, output_codes)
 
     # Join patterns and their respective metrics, side by side
     return pd.concat([all_patterns_df, pattern_metrics], axis=1)
 
 
-def convert_patterns_to_df(patterns_list: list, col_names: list,
-                           pattern_length: int) -> pd.DataFrame:
+def convert_patterns_to_df(pattern_window_ids: np.ndarray, window_values: list,
+                           col_names: list, pattern_length: int,
+                           output_codes: bool = False) -> pd.DataFrame:
     """Summary
-        Convert list of jsons into a dataframe of patterns
+        Builds the dataframe of patterns column-wise, every distinct window is rendered
+    once: its values joined by spaces (blank for attributes not in a pattern)
     Args:
+        pattern_window_ids (np.ndarray): window id of every pattern (row) and attribute
+    (column), -1 if the attribute is not in the pattern
+        window_values (list): raw values of every distinct window (row per window id),
+    per attribute
         col_names (list): list of column names for attributes
-        patterns_list (list): list of all patterns enumerated, as jsons
         pattern_length (int): Individual pattern length is constant
+        output_codes (bool, optional): window ids instead of the joined values
+    """
+    if output_codes:
+        return pd.DataFrame(pattern_window_ids, columns=col_names)
+
+    empty_value = ' '.join([''] * pattern_length)
+    all_patterns = dict()
+    for dim, attr_col_name in enumerate(col_names):
+        window_ids = pattern_window_ids[:, dim]
+        is_present = window_ids >= 0
+        distinct_ids, distinct_positions = np.unique(window_ids[is_present],
+                                                     return_inverse=True)
+
+        attr_values = np.full(len(window_ids), empty_value, dtype=object)
+        attr_values[is_present] = _render_windows(
+            np.asarray(window_values[dim])[distinct_ids])[distinct_positions]
+        all_patterns[attr_col_name] = attr_values
+
+    return pd.DataFrame(all_patterns, columns=col_names)
+
+
+def _render_windows(window_values: np.ndarray) -> np.ndarray:
+    """Summary
+        values of each window (row) as strings joined by spaces, windows of whole valued
+    floats are written as integers
     """
+    rendered_values = window_values.astype(str).astype(object)
+    if window_values.dtype.kind == 'f':
+        is_whole = np.all(np.isfinite(window_values) & (np.abs(window_values) < 2 ** 63) &
+                          (window_values == np.floor(window_values)), axis=1)
+        rendered_values[is_whole] = window_values[is_whole].astype(np.int64).astype(
+            str).astype(object)
+
+    joined_values = rendered_values[:, 0].copy()
+    for i in range(1, rendered_values.shape[1]):
+        joined_values = joined_values + ' ' + rendered_values[:, i]
+
+    return joined_values
+
+
+class MiningSession:
+
+    def __init__(self, col_names: list, pattern_length: int,
+                 enum_pattern_inst: EnumeratedPattern, window_values: list,
+                 mining_stats: dict = None) -> None:
+        """Summary
+            col_names: feature column names, in the order of pattern key dimensions
+            window_values: raw values of every distinct window (row per window id), per
+        feature column
+            mining_stats: PatternMiner stats of the mining run, if known
+        """
+        self._col_names = col_names
+        self._pattern_length = pattern_length
+        self._enum_pattern_inst = enum_pattern_inst
+        self._window_values = window_values
+        self._mining_stats = mining_stats
+
+    def get_enum_pattern_inst(self) -> EnumeratedPattern:
+        return self._enum_pattern_inst
+
+    def get_window_values(self, dim: int) -> np.ndarray:
+        return self._window_values[dim]
+
+    def get_mining_stats(self) -> dict:
+        return self._mining_stats
+
+    def get_pattern_df(self, pattern_key: tuple) -> pd.DataFrame:
+        """Summary
+            Reconstructs the dataframe segment represented by a compact pattern key
+        """
+        mask, window_ids = pattern_key
+        return pd.DataFrame({self._col_names[dim]: self._window_values[dim][window_id]
+                             for dim, window_id in zip(mask_to_dimensions(mask), window_ids)})
 
-    all_patterns_df = pd.DataFrame()
-    for pattern_str in patterns_list:
+    def query(self, output_metric: str = 'crossk', output_type: str = 'topk',
+              topk: int = 100, output_threshold: float = -1,
+              pattern_filter: np.ndarray = None,
+              output_codes: bool = False) -> pd.DataFrame:
+        """Summary
+            patterns and metrics, as returned by mine_sequence_patterns for these output
+        parameters (among patterns of pattern_filter, if provided)
+        """
+        return format_output(self._col_names, self._enum_pattern_inst, self,
+                             self._pattern_length, output_metric, output_type,
+                             k=topk, threshold=output_threshold, pattern_filter=pattern_filter,
+                             output_codes=output_codes)
 
-        # Converting from json to dataframe
-        pattern_df = pd.read_json(pattern_str)
+    def save(self, file_path: str) -> None:
+        """Summary
+            saves the session as a .npz snapshot (no pickled objects)
+        """
+        if any(np.asarray(x).dtype == object for x in self._window_values):
+            raise Exception('Object valued columns can not be saved in a snapshot')
 
-        # Convert all values to string
-        pattern_df = pattern_df.applymap(str)
+        snapshot = self._enum_pattern_inst.get_snapshot()
+        snapshot[snapshot_col_names] = np.array(self._col_names, dtype=str)
+        snapshot[snapshot_pattern_length] = np.array(self._pattern_length)
+        for dim, window_values in enumerate(self._window_values):
+            snapshot[snapshot_window_values.format(dim)] = window_values
+        if self._mining_stats is not None:
+            snapshot[snapshot_mining_stats] = np.array(json.dumps(self._mining_stats))
 
-        # Insert empty attributes columns, in place, not present in current pattern
-        for i, attr_col_name in enumerate(col_names):
-            if attr_col_name not in pattern_df.columns:
-                pattern_df.insert(i, attr_col_name, [''] * pattern_length)
+        np.savez(file_path, **snapshot)
 
-        # Insert a dummy index columns for grouping
-        pattern_df[dummy_col_name] = dummy_col_value
+    @classmethod
+    def load(cls, file_path: str) -> 'MiningSession':
+        """Summary
+            session from a snapshot saved with save
+        """
+        with np.load(file_path, allow_pickle=False) as snapshot:
+            snapshot = dict(snapshot)
 
-        # Compress multiple pattern rows into one row
-        compress_pattern_df = pattern_df.groupby(dummy_col_name).apply(
-            lambda x: [' '.join(x[i]) for i in col_names]).apply(pd.Series).reset_index(drop=True)
-        compress_pattern_df.columns = col_names
+        col_names = snapshot[snapshot_col_names].tolist()
+        window_values = [snapshot[snapshot_window_values.format(dim)]
+                         for dim in range(len(col_names))]
 
-        # append each pattern
-        all_patterns_df = all_patterns_df.append(compress_pattern_df)
+        mining_stats = None
+        if snapshot_mining_stats in snapshot:
+            mining_stats = json.loads(str(snapshot[snapshot_mining_stats]))
 
-    return all_patterns_df.reset_index(drop=True)
+        return cls(col_names, int(snapshot[snapshot_pattern_length]),
+                   EnumeratedPattern.from_snapshot(snapshot), window_values, mining_stats)
@@ -1,2 +1,3 @@
 from .count_strategy import PatternCountStrategy
 from .stategraph import SequenceMap
+from .occurences import OccurenceSet, VerticalOccurences
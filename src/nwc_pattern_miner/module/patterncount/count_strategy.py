@@ -4,5 +4,33 @@ import pandas as pd
 class PatternCountStrategy(metaclass=ABCMeta):
 
     @abstractmethod
-    def find_pattern_occurences(self, pattern_df: pd.DataFrame) -> list:
+    def find_pattern_occurences(self, pattern_df: pd.DataFrame):
+        pass
+
+    @abstractmethod
+    def get_fingerprint(self) -> str:
+        pass
+
+    @abstractmethod
+    def get_window_ids(self, start_index: int) -> list:
+        pass
+
+    @abstractmethod
+    def get_segment_ids(self, start_indexes: list):
+        pass
+
+    @abstractmethod
+    def get_window_occurences(self, dim: int, window_id: int):
+        pass
+
+    @abstractmethod
+    def get_window_values(self, dim: int):
+        pass
+
+    @abstractmethod
+    def find_key_occurences(self, pattern_key: tuple):
+        pass
+
+    @abstractmethod
+    def get_pattern_df(self, pattern_key: tuple) -> pd.DataFrame:
         pass
@@ -0,0 +1,186 @@
+# Occurence sets (sorted arrays for sparse, packed bit arrays for dense occurences) and
+# their intersections, vertical (Eclat style) derivation of pattern occurences from
+# already known subpattern occurences
+import numpy as np
+
+from ..utilities import mask_to_dimensions
+from .count_strategy import PatternCountStrategy
+
+# Specific constants
+# a bitset of n readings takes n / 8 bytes, a sorted int64 array 8 bytes per occurence
+bitset_density_threshold = 1 / 64
+popcount_table = np.array([bin(x).count('1') for x in range(256)], dtype=np.uint8)
+
+
+def intersect_occurences(occurences_a: np.ndarray, occurences_b: np.ndarray) -> np.ndarray:
+    """Summary
+        intersection of two sorted occurence arrays, binary searching the smaller
+    array in the larger one
+    """
+    if len(occurences_a) > len(occurences_b):
+        occurences_a, occurences_b = occurences_b, occurences_a
+
+    if len(occurences_a) == 0:
+        return occurences_a
+
+    positions = np.searchsorted(occurences_b, occurences_a)
+    positions[positions == len(occurences_b)] = 0
+
+    return occurences_a[occurences_b[positions] == occurences_a]
+
+
+def intersect_all_occurences(combined_occurences: list):
+    """Summary
+        intersection of many occurence sets, smallest first
+    """
+    combined_occurences = sorted(combined_occurences, key=len)
+    pattern_occurences = combined_occurences[0]
+    for occurences in combined_occurences[1:]:
+        pattern_occurences = pattern_occurences.intersect(occurences)
+
+    return pattern_occurences
+
+
+class OccurenceSet:
+
+    def __init__(self, num_of_windows: int, indexes: np.ndarray = None,
+                 bits: np.ndarray = None, count: int = -1) -> None:
+        """Summary
+            Start offsets of a pattern, either as a sorted array (sparse) or as a bit
+        array packed over all num_of_windows offsets (dense)
+        """
+        self._num_of_windows = num_of_windows
+        self._indexes = indexes
+        self._bits = bits
+
+        if indexes is not None:
+            count = len(indexes)
+        elif count == -1:
+            count = int(popcount_table[bits].sum())
+        self._count = count
+
+    @classmethod
+    def from_indexes(cls, num_of_windows: int, indexes: np.ndarray) -> 'OccurenceSet':
+        """Summary
+            representation chosen by density of the occurences
+        """
+        if len(indexes) > num_of_windows * bitset_density_threshold:
+            is_occurence = np.zeros(num_of_windows, dtype=bool)
+            is_occurence[indexes] = True
+            return cls(num_of_windows, bits=np.packbits(is_occurence), count=len(indexes))
+
+        return cls(num_of_windows, indexes=indexes)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def is_bitset(self) -> bool:
+        return self._bits is not None
+
+    def get_bits(self) -> np.ndarray:
+        return self._bits
+
+    def get_indexes(self) -> np.ndarray:
+        """Summary
+            sorted start offsets, unpacked if stored as bitset
+        """
+        if self._bits is not None:
+            return np.flatnonzero(np.unpackbits(self._bits, count=self._num_of_windows))
+
+        return self._indexes
+
+    def get_first_index(self) -> int:
+        if self._count == 0:
+            return -1
+
+        if self._bits is not None:
+            first_byte = np.flatnonzero(self._bits)[0]
+            return int(first_byte * 8 + 8 - int(self._bits[first_byte]).bit_length())
+
+        return int(self._indexes[0])
+
+    def _get_bit_values(self, indexes: np.ndarray) -> np.ndarray:
+        return (self._bits[indexes >> 3] >> (7 - (indexes & 7))) & 1
+
+    def intersect(self, other: 'OccurenceSet') -> 'OccurenceSet':
+        """Summary
+            AND of two bitsets (kept dense only if still dense), bit tests of a sorted
+        array against a bitset, or a sorted merge of two sorted arrays
+        """
+        if self._bits is not None and other._bits is not None:
+            bits = np.bitwise_and(self._bits, other._bits)
+            result = OccurenceSet(self._num_of_windows, bits=bits)
+            if len(result) > self._num_of_windows * bitset_density_threshold:
+                return result
+
+            return OccurenceSet(self._num_of_windows, indexes=result.get_indexes())
+
+        if self._bits is not None:
+            return other.intersect(self)
+
+        if other._bits is not None:
+            return OccurenceSet(self._num_of_windows, indexes=self._indexes[
+                other._get_bit_values(self._indexes).astype(bool)])
+
+        return OccurenceSet(self._num_of_windows,
+                            indexes=intersect_occurences(self._indexes, other._indexes))
+
+
+class VerticalOccurences:
+
+    def __init__(self, pattern_count_inst: PatternCountStrategy):
+        """Summary
+            Per window cache of node occurences {number of dimensions: {mask: occurence
+        set}}, a node's occurences are derived from occurences of its children (one
+        dimension less), so only the level below the nodes being derived is kept
+        """
+        self._pattern_count_inst = pattern_count_inst
+        self._window_ids = list()
+        self._occurences = dict()
+
+    def reset(self, window_ids: list) -> None:
+        """Summary
+            clears cached occurences, for a new window
+        """
+        self._window_ids = window_ids
+        self._occurences = dict()
+
+    def get_occurences(self, mask: int) -> OccurenceSet:
+        """Summary
+            occurences of node in current window: intersection of the two smallest known
+        children, or a known child with the missing dimension, or all dimensions
+        """
+        num_of_dims = bin(mask).count('1')
+        level_occurences = self._occurences.get(num_of_dims)
+        if level_occurences is None:
+            # first node of a level, levels below its children are not needed anymore
+            for cached_num_of_dims in [x for x in self._occurences if x < num_of_dims - 1]:
+                del self._occurences[cached_num_of_dims]
+            level_occurences = self._occurences[num_of_dims] = dict()
+
+        if mask in level_occurences:
+            return level_occurences[mask]
+
+        dimensions = mask_to_dimensions(mask)
+
+        # known children, along with the dimension each one lacks
+        children_occurences = self._occurences.get(num_of_dims - 1, dict())
+        known_children = [(children_occurences[mask ^ (1 << dim)], dim) for dim in dimensions
+                          if mask ^ (1 << dim) in children_occurences]
+
+        if len(known_children) >= 2:
+            known_children.sort(key=lambda x: len(x[0]))
+            pattern_occurences = known_children[0][0].intersect(known_children[1][0])
+        elif len(known_children) == 1:
+            child_occurences, dim = known_children[0]
+            pattern_occurences = child_occurences.intersect(
+                self._get_dimension_occurences(dim))
+        else:
+            pattern_occurences = intersect_all_occurences(
+                [self._get_dimension_occurences(dim) for dim in dimensions])
+
+        level_occurences[mask] = pattern_occurences
+        return pattern_occurences
+
+    def _get_dimension_occurences(self, dim: int) -> OccurenceSet:
+        return self._pattern_count_inst.get_window_occurences(dim, self._window_ids[dim])
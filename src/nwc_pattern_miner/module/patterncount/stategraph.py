@@ -1,56 +1,463 @@
 # Maintains a hashmap with single transitions for each attribute
-import sys
+import os
+import shutil
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import pandas as pd
 
-from ..utilities import print_fun
+from ..utilities import print_fun, mask_to_dimensions, SegmentBoundaries
 from .count_strategy import PatternCountStrategy
+from .occurences import OccurenceSet, intersect_all_occurences, bitset_density_threshold
+
+# Specific constants
+# index arrays of every feature column, as files of an index cache
+index_array_names = ['window_ids', 'window_values', 'occurence_order', 'occurence_offsets',
+                     'dense_rows', 'dense_bits']
+# directory of an index cache, per data fingerprint. The fingerprint file is written
+# last, a cache without it (or with another fingerprint) is rebuilt
+index_dir_name = 'seqmap_{0}'
+fingerprint_file_name = 'fingerprint'
+index_cache_version = 1
 
 class SequenceMap(PatternCountStrategy):
 
-    def __init__(self, data: pd.DataFrame, nc_window_col_name: str):
+    def __init__(self, data: pd.DataFrame, nc_window_col_name: str,
+                 segment_boundaries: SegmentBoundaries = None):
+        """Summary
+            segment_boundaries: if provided, windows crossing a segment boundary are
+        not counted as occurences
+        """
         self._data = data
+        self._segment_boundaries = segment_boundaries
         self._data_length = data.shape[0]
         self._feature_col_names = list(
             data.columns[data.columns != nc_window_col_name])
-        self._seq_hashmap = dict()
+        self._pattern_length = 0
+
+        # Per feature column (in the order of feature_col_names):
+        # window_ids: id of the window starting at each offset
+        # window_values: raw values of every distinct window, row per id
+        # occurence_order: window start offsets, grouped by id and sorted within a group
+        # occurence_offsets: boundaries of each id's group in occurence_order (sparse ids)
+        # dense_rows: row of each id in dense_bits, -1 for sparse ids
+        # dense_bits: packed bit arrays over window start offsets, row per dense id
+        self._num_of_windows = 0
+        # codes of every column, kept while the index is to be extended
+        self._max_pattern_length = 0
+        self._column_codes = list()
+        self._reset_index()
 
-    def init_seq_map(self, pattern_length: int) -> None:
+    def init_seq_map(self, pattern_length: int, n_jobs: int = 1, cache_dir: str = None,
+                     max_pattern_length: int = None) -> None:
         """Summary
-            Creates hashmap of sequences for efficient support count
+            Creates hashmap of sequences for efficient support count, columns are
+        indexed independently (in a thread pool if n_jobs > 1, numpy sorts release the GIL).
+        With a cache_dir, the index is memory mapped from an earlier build of the same
+        data, or built and saved there. Codes of the columns are kept till the index is
+        extended to max_pattern_length (see extend_seq_map)
         """
-        # Separately for each dimension
-        for fc in self._feature_col_names:
-            if fc not in self._seq_hashmap:
-                self._seq_hashmap[fc] = dict()
+        self._pattern_length = pattern_length
+        self._num_of_windows = max(self._data_length - pattern_length + 1, 0)
+        self._keep_column_codes(max_pattern_length)
+
+        index_path = None
+        if cache_dir is not None:
+            index_path = os.path.join(cache_dir, index_dir_name.format(self.get_fingerprint()))
+            if self.load_index(index_path):
+                print_fun('Loaded Sequence Hashing for Support Count from: ' + index_path)
+                return
+
+        self._reset_index()
+
+        # Separately for each dimension, all windows at once
+        self._index_columns(lambda dim: _build_column_index(
+            *self._code_dimension(dim), pattern_length), n_jobs)
+
+        if index_path is not None:
+            self.save_index(index_path)
+
+    def extend_seq_map(self, pattern_length: int, n_jobs: int = 1) -> None:
+        """Summary
+            Extends the index to a longer pattern length, one reading at a time: a window
+        id of length k + 1 ranks the pair (window id of length k, next reading), so windows
+        of length k + 1 are grouped within the windows of length k they extend
+        """
+        if pattern_length < self._pattern_length:
+            raise Exception('Sequence index can only be extended to longer patterns')
+
+        if len(self._column_codes) == 0:
+            self._keep_column_codes(pattern_length)
+
+        while self._pattern_length < pattern_length:
+            self._pattern_length += 1
+            self._num_of_windows = max(self._data_length - self._pattern_length + 1, 0)
+            shorter_window_ids = self._window_ids
+
+            self._reset_index()
+            self._index_columns(lambda dim: _extend_column_index(
+                shorter_window_ids[dim], *self._code_dimension(dim), self._pattern_length),
+                n_jobs)
+
+        # codes are not needed after the last extension
+        if self._pattern_length >= self._max_pattern_length:
+            self._column_codes = list()
+
+    def _keep_column_codes(self, max_pattern_length: int) -> None:
+        """Summary
+            codes of every column are kept (once coded) if the index is to be extended
+        beyond its pattern length
+        """
+        self._max_pattern_length = max(self._pattern_length, max_pattern_length or 0)
+        if self._max_pattern_length > self._pattern_length:
+            self._column_codes = [None] * len(self._feature_col_names)
+        else:
+            self._column_codes = list()
+
+    def _code_dimension(self, dim: int) -> tuple:
+        """Summary
+            distinct values and codes of a column (see _code_column), coded within the
+        per column function of the thread pool
+        """
+        if len(self._column_codes) == 0:
+            return _code_column(self._data[self._feature_col_names[dim]].to_numpy())
+
+        if self._column_codes[dim] is None:
+            self._column_codes[dim] = _code_column(
+                self._data[self._feature_col_names[dim]].to_numpy())
+
+        return self._column_codes[dim]
+
+    def _index_columns(self, index_column, n_jobs: int) -> None:
+        """Summary
+            index arrays of every column (index_column(dim) returns window ids, window values
+        and occurence order / offsets), in a thread pool if n_jobs > 1
+        """
+        is_valid_window = None
+        if self._segment_boundaries is not None:
+            start_indexes = np.arange(self._num_of_windows)
+            is_valid_window = ~self._segment_boundaries.crosses_all(
+                start_indexes, start_indexes + self._pattern_length)
 
-            # hashing complete pattern for each dimention
-            for idx in range(self._data_length - pattern_length + 1):
-                seq_key = tuple(self._data[fc].iloc[idx: idx + pattern_length])
+        def index_dimension(dim: int) -> tuple:
+            window_ids, window_values, order, offsets = index_column(dim)
+            if is_valid_window is not None:
+                order, offsets = _drop_windows(window_ids, order, offsets, is_valid_window)
+            return (window_ids, window_values) + _split_dense_occurences(
+                order, offsets, self._num_of_windows)
 
-                if seq_key not in self._seq_hashmap[fc]:
-                    self._seq_hashmap[fc][seq_key] = list()
+        dimensions = range(len(self._feature_col_names))
+        if n_jobs > 1 and len(dimensions) > 1:
+            with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                columns_index = list(executor.map(index_dimension, dimensions))
+        else:
+            columns_index = [index_dimension(dim) for dim in dimensions]
 
-                self._seq_hashmap[fc][seq_key].append(idx)
+        for window_ids, window_values, order, offsets, dense_rows, dense_bits in columns_index:
+            self._window_ids.append(window_ids)
+            self._window_values.append(window_values)
+            self._occurence_order.append(order)
+            self._occurence_offsets.append(offsets)
+            self._dense_rows.append(dense_rows)
+            self._dense_bits.append(dense_bits)
 
-        size_of_map = sys.getsizeof(self._seq_hashmap) / 1000000
+        size_of_map = self.get_index_size() / 1000000
         message = 'Completed Sequence Hashing for Support Count (HashSize): ' + str(
             size_of_map) + ' MB'
         print_fun(message)
 
-    def find_pattern_occurences(self, pattern_df: pd.DataFrame) -> list:
+    def _reset_index(self) -> None:
+        self._window_ids = list()
+        self._window_values = list()
+        self._occurence_order = list()
+        self._occurence_offsets = list()
+        self._dense_rows = list()
+        self._dense_bits = list()
+        self._seq_hashmap = dict()
+
+    def _get_index_arrays(self) -> dict:
+        return {'window_ids': self._window_ids, 'window_values': self._window_values,
+                'occurence_order': self._occurence_order,
+                'occurence_offsets': self._occurence_offsets,
+                'dense_rows': self._dense_rows, 'dense_bits': self._dense_bits}
+
+    def get_fingerprint(self) -> str:
+        """Summary
+            content hash of the data (feature columns, their names and values), segment
+        boundaries and pattern length, identifying the index built from them
+        """
+        fingerprint = hashlib.blake2b(digest_size=16)
+        fingerprint.update(repr((index_cache_version, self._pattern_length,
+                                 self._feature_col_names)).encode())
+
+        for fc in self._feature_col_names:
+            fingerprint.update(str(self._data[fc].dtype).encode())
+            fingerprint.update(pd.util.hash_pandas_object(
+                self._data[fc], index=False).to_numpy().tobytes())
+
+        if self._segment_boundaries is not None:
+            fingerprint.update(self._segment_boundaries.get_break_counts().tobytes())
+
+        return fingerprint.hexdigest()
+
+    def save_index(self, index_path: str) -> None:
+        """Summary
+            saves index arrays (one .npy file per column and array) along with the data
+        fingerprint, skipped for object valued columns (which can not be memory mapped).
+        Saved to a temporary directory renamed into place, a saved index is never changed
+        """
+        if any(x.dtype == object for x in self._window_values):
+            print_fun('Sequence Hashing not cached, object valued columns')
+            return
+
+        if os.path.exists(os.path.join(index_path, fingerprint_file_name)):
+            return
+
+        parent_dir = os.path.dirname(os.path.abspath(index_path))
+        os.makedirs(parent_dir, exist_ok=True)
+        temp_path = tempfile.mkdtemp(dir=parent_dir, prefix=os.path.basename(index_path) + '.')
+        try:
+            for name, arrays in self._get_index_arrays().items():
+                for dim, arr in enumerate(arrays):
+                    np.save(os.path.join(temp_path, '{0}_{1}.npy'.format(name, dim)), arr)
+
+            with open(os.path.join(temp_path, fingerprint_file_name), 'w') as fingerprint_file:
+                fingerprint_file.write(self.get_fingerprint())
+
+            # fails if another writer saved the same index meanwhile, which is kept
+            os.rename(temp_path, index_path)
+        except OSError:
+            if not os.path.exists(os.path.join(index_path, fingerprint_file_name)):
+                raise
+        finally:
+            if os.path.exists(temp_path):
+                shutil.rmtree(temp_path)
+
+    def load_index(self, index_path: str) -> bool:
+        """Summary
+            memory maps index arrays saved for the same data fingerprint, returns if
+        loaded (False for a missing or stale cache)
+        """
+        fingerprint_path = os.path.join(index_path, fingerprint_file_name)
+        if not os.path.exists(fingerprint_path):
+            return False
+
+        with open(fingerprint_path) as fingerprint_file:
+            if fingerprint_file.read() != self.get_fingerprint():
+                return False
+
+        self._reset_index()
+        for name, arrays in self._get_index_arrays().items():
+            for dim in range(len(self._feature_col_names)):
+                arrays.append(np.load(os.path.join(index_path, '{0}_{1}.npy'.format(name, dim)),
+                                      mmap_mode='r'))
+
+        return True
+
+    def get_index_size(self) -> int:
+        """Summary
+            returns number of bytes held by the sequence index arrays
+        """
+        return sum(arr.nbytes for arrays in (self._window_ids, self._window_values,
+                                             self._occurence_order, self._occurence_offsets,
+                                             self._dense_rows, self._dense_bits)
+                   for arr in arrays)
+
+    def get_seq_hashmap(self) -> dict:
+        """Summary
+            returns {column: {window values (tuple): occurence set}} mapping,
+        built lazily from the index arrays
+        """
+        if len(self._seq_hashmap) == 0:
+            for dim, fc in enumerate(self._feature_col_names):
+                self._seq_hashmap[fc] = {
+                    seq_key: self.get_window_occurences(dim, window_id)
+                    for window_id, seq_key in enumerate(
+                        map(tuple, self._window_values[dim].tolist()))}
+
+        return self._seq_hashmap
+
+    def get_window_values(self, dim: int) -> np.ndarray:
+        """Summary
+            raw values of every distinct window of a dimension, row per window id
+        """
+        return self._window_values[dim]
+
+    def get_window_occurences(self, dim: int, window_id: int) -> OccurenceSet:
+        """Summary
+            returns start offsets of a window id in a dimension, as bitset if dense
+        """
+        dense_row = self._dense_rows[dim][window_id]
+        if dense_row != -1:
+            return OccurenceSet(self._num_of_windows, bits=self._dense_bits[dim][dense_row])
+
+        offsets = self._occurence_offsets[dim]
+        return OccurenceSet(self._num_of_windows, indexes=self._occurence_order[dim][
+            offsets[window_id]: offsets[window_id + 1]])
+
+    def find_pattern_occurences(self, pattern_df: pd.DataFrame) -> OccurenceSet:
         """Summary
             Finds pattern occurences in the data
         """
+        seq_hashmap = self.get_seq_hashmap()
 
         combined_dim_occurences = list()
         for name in pattern_df.columns:
             dim_pattern = tuple(pattern_df[name])
 
-            if dim_pattern not in self._seq_hashmap[name]:
-                return list()
+            if dim_pattern not in seq_hashmap[name]:
+                return OccurenceSet(self._num_of_windows, indexes=np.empty(0, dtype=np.int64))
+
+            combined_dim_occurences.append(seq_hashmap[name][dim_pattern])
+
+        return intersect_all_occurences(combined_dim_occurences)
+
+    def get_window_ids(self, start_index: int) -> list:
+        """Summary
+            returns window id of every dimension, for the window starting at start_index
+        """
+        return [int(window_ids[start_index]) for window_ids in self._window_ids]
+
+    def get_segment_ids(self, start_indexes: list) -> np.ndarray:
+        """Summary
+            window ids of every dimension (column), for many start indexes (row),
+        identical data segments have identical rows
+        """
+        return np.column_stack([window_ids[start_indexes] for window_ids in self._window_ids])
+
+    def find_key_occurences(self, pattern_key: tuple) -> OccurenceSet:
+        """Summary
+            Finds occurences of a pattern identified by its compact key
+        """
+        mask, window_ids = pattern_key
+        combined_dim_occurences = [self.get_window_occurences(dim, window_id) for dim, window_id
+                                   in zip(mask_to_dimensions(mask), window_ids)]
+
+        return intersect_all_occurences(combined_dim_occurences)
+
+    def get_pattern_df(self, pattern_key: tuple) -> pd.DataFrame:
+        """Summary
+            Reconstructs the dataframe segment represented by a compact pattern key
+        """
+        mask, window_ids = pattern_key
+        dimensions = mask_to_dimensions(mask)
+
+        return pd.DataFrame({self._feature_col_names[dim]: self._window_values[dim][window_id]
+                             for dim, window_id in zip(dimensions, window_ids)})
+
+
+def _code_column(column_values: np.ndarray) -> tuple:
+    """Summary
+        distinct values of a column (sorted) and the code of every reading
+    """
+    uniques, codes = np.unique(column_values, return_inverse=True)
+    return uniques, codes.astype(np.int64).reshape(-1)
+
+
+def _build_column_index(uniques: np.ndarray, codes: np.ndarray, pattern_length: int) -> tuple:
+    """Summary
+        Vectorised sliding window index of a single (coded) column. Every window is
+    packed into one integer key (shifted slices of the codes), and a single stable sort
+    groups window start offsets by key.
+    """
+    num_of_windows = max(len(codes) - pattern_length + 1, 0)
+    cardinality = max(len(uniques), 1)
+
+    # Packing windows into integer keys, compressing keys to dense ranks when
+    # the next digit would overflow int64
+    window_keys = codes[:num_of_windows].copy()
+    key_range = cardinality
+    for i in range(1, pattern_length):
+        if key_range > np.iinfo(np.int64).max // cardinality:
+            window_keys = np.unique(window_keys, return_inverse=True)[1].astype(np.int64)
+            key_range = int(window_keys.max()) + 1 if num_of_windows else 1
+
+        window_keys = window_keys * cardinality + codes[i: i + num_of_windows]
+        key_range *= cardinality
+
+    return _group_windows(window_keys, uniques, codes, pattern_length)
+
+
+def _extend_column_index(shorter_window_ids: np.ndarray, uniques: np.ndarray,
+                         codes: np.ndarray, pattern_length: int) -> tuple:
+    """Summary
+        Window index of a column from the window ids of one reading shorter windows.
+    Ids are ranks of lexicographically sorted windows, so ranking (shorter id, next
+    code) gives the same ids as a fresh build
+    """
+    num_of_windows = max(len(codes) - pattern_length + 1, 0)
+    cardinality = max(len(uniques), 1)
+
+    window_keys = (np.asarray(shorter_window_ids[:num_of_windows]) * cardinality +
+                   codes[pattern_length - 1: pattern_length - 1 + num_of_windows])
+
+    return _group_windows(window_keys, uniques, codes, pattern_length)
+
+
+def _group_windows(window_keys: np.ndarray, uniques: np.ndarray, codes: np.ndarray,
+                   pattern_length: int) -> tuple:
+    """Summary
+        Dense window ids (ranks of window keys), start offsets grouped by id and the raw
+    values of every distinct window
+    """
+    num_of_windows = len(window_keys)
+
+    # One stable sort: groups offsets by key, keeping them sorted within each group
+    order = np.argsort(window_keys, kind='stable')
+    sorted_keys = window_keys[order]
+    is_new_key = np.empty(num_of_windows, dtype=bool)
+    is_new_key[:1] = True
+    np.not_equal(sorted_keys[1:], sorted_keys[:-1], out=is_new_key[1:])
+
+    window_ids = np.empty(num_of_windows, dtype=np.int64)
+    window_ids[order] = np.cumsum(is_new_key) - 1
+
+    group_starts = np.flatnonzero(is_new_key)
+    offsets = np.append(group_starts, num_of_windows)
+
+    # Raw values of each distinct window, recovered from its first occurence
+    first_starts = order[group_starts]
+    window_values = uniques[codes[first_starts[:, None] + np.arange(pattern_length)]]
+
+    return window_ids, window_values, order, offsets
+
+
+def _drop_windows(window_ids: np.ndarray, order: np.ndarray, offsets: np.ndarray,
+                  is_valid_window: np.ndarray) -> tuple:
+    """Summary
+        Removes invalid windows (crossing segments) from the occurences of every id,
+    window ids stay unchanged
+    """
+    order = order[is_valid_window[order]]
+    counts = np.bincount(window_ids[is_valid_window], minlength=len(offsets) - 1)
+
+    return order, np.append(0, np.cumsum(counts))
+
+
+def _split_dense_occurences(order: np.ndarray, offsets: np.ndarray,
+                            num_of_windows: int) -> tuple:
+    """Summary
+        Moves occurences of dense window ids into packed bit arrays, keeping sorted
+    arrays (order / offsets) only for sparse ids
+    """
+    counts = np.diff(offsets)
+    is_dense = counts > num_of_windows * bitset_density_threshold
+    dense_ids = np.flatnonzero(is_dense)
+
+    dense_rows = np.full(len(counts), -1, dtype=np.int64)
+    dense_rows[dense_ids] = np.arange(len(dense_ids))
+    dense_bits = np.zeros((len(dense_ids), (num_of_windows + 7) // 8), dtype=np.uint8)
+
+    for row, window_id in enumerate(dense_ids):
+        is_occurence = np.zeros(num_of_windows, dtype=bool)
+        is_occurence[order[offsets[window_id]: offsets[window_id + 1]]] = True
+        dense_bits[row] = np.packbits(is_occurence)
 
-            combined_dim_occurences.append(
-                self._seq_hashmap[name][dim_pattern])
+    if len(dense_ids) > 0:
+        order = order[np.repeat(~is_dense, counts)]
+        counts[is_dense] = 0
+        offsets = np.append(0, np.cumsum(counts))
 
-        # finding intersection of all dimensions to report back complete pattern occurence
-        return list(set(combined_dim_occurences[0]).intersection(*combined_dim_occurences))
+    return order, offsets, dense_rows, dense_bits
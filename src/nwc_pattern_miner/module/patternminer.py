@@ -1,41 +1,326 @@
 """Summary
     Mines patterns using enumeration, pruning and pattern counting strategy
 """
+import os
+import json
+import time
+import multiprocessing
+import numpy as np
 from tqdm import tqdm
-from bisect import bisect_left
 
-from .utilities import print_fun
+from .utilities import print_fun, SegmentBoundaries
 from .pruning import PruningStrategy
 from .mining import EnumeratedPattern
 
+# Specific constants
+# windows are split into these many chunks per worker, for load balancing
+chunks_per_job = 4
+# order of mining windows: as in the data, or densest anomaly clusters first
+window_orders = ['data', 'density']
+# seconds between checkpoints, and names of checkpoint arrays other than the snapshot
+# of enumerated patterns
+default_checkpoint_interval = 300
+checkpoint_config = 'miner_config'
+pruning_state_prefix = 'pruning_'
+# State inherited by forked worker processes: the pruning instance (sharing the read
+# only sequence index copy-on-write) and its enumeration instance, reset per chunk
+_worker_state = dict()
+
 
 class PatternMiner:
     def __init__(self, pattern_length: int, num_of_dims: int,
-                 invalid_seq_indexes: list,
+                 invalid_seq_indexes,
                  enum_pattern_inst: EnumeratedPattern,
-                 pruning_inst: PruningStrategy):
+                 pruning_inst: PruningStrategy, n_jobs: int = 1,
+                 time_budget: float = None, max_enumerations: int = None,
+                 cancel_token=None, window_order: str = 'data',
+                 checkpoint_path: str = None,
+                 checkpoint_interval: float = default_checkpoint_interval):
+        """Summary
+            Mining stops between windows, keeping patterns enumerated so far, once
+        time_budget (seconds) elapses, max_enumerations patterns are enumerated or
+        cancel_token (anything with is_set(), e.g. threading.Event) is set (between
+        chunks of windows when mining in parallel). With
+        window_order='density', windows with most anomalies (within pattern length and
+        lag) are mined first, so partial results cover the densest anomaly clusters (the
+        output is ordered by enumeration, see _order_windows).
+        With a checkpoint_path, progress is saved every checkpoint_interval seconds (and
+        when mining stops), see resume
+        """
+        if window_order not in window_orders:
+            raise Exception('Window order not supported: ' + str(window_order))
 
         self._pattern_length = pattern_length
         self._num_of_dims = num_of_dims
-        self._invalid_seq_indexes = invalid_seq_indexes
         self._enum_pattern_inst = enum_pattern_inst
         self._pruning_inst = pruning_inst
+        self._n_jobs = n_jobs
+        self._time_budget = time_budget
+        self._max_enumerations = max_enumerations
+        self._cancel_token = cancel_token
+        self._window_order = window_order
+        self._checkpoint_path = checkpoint_path
+        self._checkpoint_interval = checkpoint_interval
 
         self._lag = enum_pattern_inst.get_lag()
         self._num_of_readings = enum_pattern_inst.get_num_of_readings()
         self._anomalous_windows = enum_pattern_inst.get_anomalous_windows()
 
+        if isinstance(invalid_seq_indexes, SegmentBoundaries):
+            self._segment_boundaries = invalid_seq_indexes
+        else:
+            self._segment_boundaries = SegmentBoundaries(
+                invalid_seq_indexes, self._num_of_readings)
         self._visited_indexes = set()
+        self.num_of_duplicate_windows = 0
+
+        # progress, partial if mining stopped early
+        self.is_partial = False
+        self.stop_reason = None
+        self.num_of_windows = 0
+        self.num_of_mined_windows = 0
+        self.num_of_covered_anomalous_windows = 0
+        self._start_time = None
+        self._last_checkpoint_time = None
+        self._checkpoint_config = None
+        self._initial_num_of_patterns = 0
+
+        # windows in mining order (after the duplicate segments are dropped), all valid
+        # windows and the mined window standing for each of them
+        self._mined_start_indexes = list()
+        self._start_indexes = list()
+        self._representative_indexes = list()
+        self._saved_enumerations = 0
 
     def mine(self) -> None:
         """Summary
             Mines sequence of co-occurence patterns
         """
         # O(n^3) for each window and each lag consider each combination of subsets
-        saved_enumerations = 0
-        valid_seq_count = 0
+        self._start_indexes = self._get_valid_start_indexes()
+        valid_seq_count = len(self._start_indexes)
+
+        # windows repeating an earlier data segment would only find enumerated patterns
+        mined_start_indexes, self._representative_indexes = self._drop_duplicate_segments(
+            self._start_indexes)
+        self.num_of_duplicate_windows = valid_seq_count - len(mined_start_indexes)
+        self._saved_enumerations = self.num_of_duplicate_windows * (2 ** self._num_of_dims - 1)
+
+        self._mined_start_indexes = self._order_windows(mined_start_indexes)
+        self.num_of_windows = len(self._mined_start_indexes)
+        self.num_of_mined_windows = 0
+
+        self._mine_remaining_windows()
+
+    def resume(self) -> None:
+        """Summary
+            Continues mining from the checkpoint at checkpoint_path (windows, enumerated
+        patterns and pruning state), with output identical to an uninterrupted run
+        """
+        with np.load(self._checkpoint_path, allow_pickle=False) as checkpoint:
+            checkpoint = dict(checkpoint)
+
+        self._check_checkpoint_config(checkpoint[checkpoint_config])
+
+        self._start_indexes = checkpoint['visited_start_indexes'].tolist()
+        self._representative_indexes = checkpoint['representative_indexes'].tolist()
+        self._mined_start_indexes = checkpoint['mined_start_indexes'].tolist()
+        self._visited_indexes = {(x, x + self._pattern_length) for x in self._start_indexes}
+        (self.num_of_mined_windows, self.num_of_duplicate_windows,
+         self._saved_enumerations) = json.loads(str(checkpoint['progress']))
+        self.num_of_windows = len(self._mined_start_indexes)
+
+        self._enum_pattern_inst.load_snapshot(checkpoint)
+        self._pruning_inst.set_state(
+            {x[len(pruning_state_prefix):]: y for x, y in checkpoint.items()
+             if x.startswith(pruning_state_prefix)})
+
+        print_fun('Resuming Mining from: {0}, Windows mined: ({1} / {2})'.format(
+            self._checkpoint_path, self.num_of_mined_windows, self.num_of_windows))
+        self._mine_remaining_windows()
+
+    def save_checkpoint(self) -> None:
+        """Summary
+            Saves mining progress to checkpoint_path as a .npz file (no pickled objects),
+        written to a temporary file first, so an interrupted save keeps the last checkpoint
+        """
+        checkpoint = self._enum_pattern_inst.get_snapshot()
+        for name, values in self._pruning_inst.get_state().items():
+            checkpoint[pruning_state_prefix + name] = values
+
+        checkpoint[checkpoint_config] = np.array(json.dumps(self._get_checkpoint_config(),
+                                                            sort_keys=True))
+        checkpoint['visited_start_indexes'] = np.array(self._start_indexes, dtype=np.int64)
+        checkpoint['representative_indexes'] = np.array(self._representative_indexes,
+                                                        dtype=np.int64)
+        checkpoint['mined_start_indexes'] = np.array(self._mined_start_indexes, dtype=np.int64)
+        # as json, enumerations saved beyond 63 dimensions do not fit an int64
+        checkpoint['progress'] = np.array(json.dumps([self.num_of_mined_windows,
+                                                      self.num_of_duplicate_windows,
+                                                      self._saved_enumerations]))
+
+        temp_path = self._checkpoint_path + '.tmp'
+        with open(temp_path, 'wb') as checkpoint_file:
+            np.savez(checkpoint_file, **checkpoint)
+        os.replace(temp_path, self._checkpoint_path)
+        self._last_checkpoint_time = time.monotonic()
+
+    def _get_checkpoint_config(self) -> dict:
+        """Summary
+            settings a checkpoint can only be resumed with: of mining, enumeration (lag,
+        target, retention) and pruning (thresholds, data fingerprint)
+        """
+        if self._checkpoint_config is None:
+            self._checkpoint_config = {'pattern_length': int(self._pattern_length),
+                                       'num_of_dims': int(self._num_of_dims),
+                                       'window_order': self._window_order}
+            self._checkpoint_config.update(self._enum_pattern_inst.get_config())
+            self._checkpoint_config.update(self._pruning_inst.get_config())
+
+        return self._checkpoint_config
+
+    def _check_checkpoint_config(self, saved_config: np.ndarray) -> None:
+        """Summary
+            raises naming the settings that differ from those of the checkpoint
+        """
+        if saved_config.dtype.kind != 'U':
+            raise Exception('Checkpoint was taken by an older version, can not be resumed')
+
+        saved_config = json.loads(str(saved_config))
+        config = json.loads(json.dumps(self._get_checkpoint_config()))
+        mismatches = sorted(x for x in saved_config.keys() | config.keys()
+                            if saved_config.get(x) != config.get(x))
+        if len(mismatches) > 0:
+            raise Exception('Checkpoint was taken with a different mining configuration: ' +
+                            ', '.join(mismatches))
+
+    def _save_checkpoint_if_due(self) -> None:
+        if (self._checkpoint_path is not None and
+                time.monotonic() - self._last_checkpoint_time >= self._checkpoint_interval):
+            self.save_checkpoint()
+
+    def _mine_remaining_windows(self) -> None:
+        """Summary
+            Mines windows after the cursor (num_of_mined_windows), in mining order
+        """
+        remaining_start_indexes = self._mined_start_indexes[self.num_of_mined_windows:]
+        self._start_time = time.monotonic()
+        self._last_checkpoint_time = self._start_time
+        self._initial_num_of_patterns = self._enum_pattern_inst.num_of_patterns
+
+        if (self._n_jobs > 1 and len(remaining_start_indexes) > 1 and
+                self._can_mine_parallel()):
+            self._mine_parallel(remaining_start_indexes)
+        else:
+            for start_pattern_index in tqdm(remaining_start_indexes):
+                if self._is_stop_requested():
+                    break
+
+                # Prune and enumerate patterns
+                self._saved_enumerations += self._pruning_inst.prune_and_enumerate_patterns(
+                    start_pattern_index, start_pattern_index + self._pattern_length)
+                self.num_of_mined_windows += 1
+                self._save_checkpoint_if_due()
+
+        if self._checkpoint_path is not None:
+            self.save_checkpoint()
+
+        self._count_covered_windows(
+            self._start_indexes, self._representative_indexes,
+            self._mined_start_indexes[:self.num_of_mined_windows])
+
+        # Calculating computations saved
+        total_patterns = len(self._start_indexes) * (2 ** self._num_of_dims - 1)
+        message = ('Completed Mining, Pattern Enumerations saved: ({0} / {1}), '
+                   'Nodes pruned: ({2}), Duplicate windows skipped: ({3})')
+        print_fun(message.format(self._saved_enumerations, total_patterns,
+                                 self._pruning_inst.num_of_pruned_nodes,
+                                 self.num_of_duplicate_windows))
+
+        if self.is_partial:
+            message = ('Stopped Mining early ({0}), Windows mined: ({1} / {2}), '
+                       'Anomalous windows covered: ({3} / {4})')
+            print_fun(message.format(self.stop_reason, self.num_of_mined_windows,
+                                     self.num_of_windows,
+                                     self.num_of_covered_anomalous_windows,
+                                     len(self._anomalous_windows)))
+
+    def get_mining_stats(self) -> dict:
+        """Summary
+            whether mining stopped early (and why), windows mined and anomalous windows
+        covered (all of their windows mined)
+        """
+        return {'is_partial': self.is_partial,
+                'stop_reason': self.stop_reason,
+                'mined_windows': self.num_of_mined_windows,
+                'total_windows': self.num_of_windows,
+                'covered_anomalous_windows': self.num_of_covered_anomalous_windows,
+                'total_anomalous_windows': len(self._anomalous_windows)}
+
+    def _is_stop_requested(self) -> bool:
+        """Summary
+            checked between windows: cancellation, time budget and enumerations budget
+        """
+        if self._cancel_token is not None and self._cancel_token.is_set():
+            self.stop_reason = 'cancelled'
+        elif (self._time_budget is not None and
+              time.monotonic() - self._start_time >= self._time_budget):
+            self.stop_reason = 'time_budget'
+        elif (self._max_enumerations is not None and
+              self._enum_pattern_inst.num_of_patterns - self._initial_num_of_patterns >=
+              self._max_enumerations):
+            self.stop_reason = 'max_enumerations'
+
+        self.is_partial = self.stop_reason is not None
+        return self.is_partial
+
+    def _order_windows(self, start_indexes: list) -> list:
+        """Summary
+            mining order of windows, densest first (stable, ties keep data order) for
+        window_order='density'. Patterns are enumerated in mining order, so the output
+        follows it: for apriori the same patterns are found, but threshold output rows
+        (and top-k patterns tied on the metric) come in another order than for 'data'
+        """
+        if self._window_order != 'density' or len(start_indexes) == 0:
+            return start_indexes
+
+        is_anomalous = np.zeros(self._num_of_readings, dtype=np.int64)
+        is_anomalous[self._anomalous_windows] = 1
+        anomaly_prefix_sums = np.concatenate([[0], np.cumsum(is_anomalous)])
+
+        start_indexes = np.asarray(start_indexes)
+        window_ends = np.minimum(start_indexes + self._pattern_length + self._lag,
+                                 self._num_of_readings)
+        window_densities = anomaly_prefix_sums[window_ends] - anomaly_prefix_sums[start_indexes]
+
+        return start_indexes[np.argsort(-window_densities, kind='stable')].tolist()
 
-        for window_index in tqdm(self._anomalous_windows):
+    def _count_covered_windows(self, start_indexes: list, representative_indexes: list,
+                               mined_start_indexes: list) -> None:
+        """Summary
+            anomalous windows with every valid window (start within lag before it) mined,
+        directly or through a window of the same data segment
+        """
+        is_mined = np.zeros(self._num_of_readings, dtype=bool)
+        is_mined[mined_start_indexes] = True
+
+        is_unmined_start = np.zeros(self._num_of_readings, dtype=np.int64)
+        is_unmined_start[np.asarray(start_indexes, dtype=np.int64)[
+            ~is_mined[representative_indexes]]] = 1
+        unmined_prefix_sums = np.concatenate([[0], np.cumsum(is_unmined_start)])
+
+        anomalous_windows = np.asarray(self._anomalous_windows, dtype=np.int64)
+        num_of_unmined = (unmined_prefix_sums[anomalous_windows + 1] -
+                          unmined_prefix_sums[np.maximum(anomalous_windows - self._lag, 0)])
+        self.num_of_covered_anomalous_windows = int(np.count_nonzero(num_of_unmined == 0))
+
+    def _get_valid_start_indexes(self) -> list:
+        """Summary
+            start indexes of all valid sequences around anomalous windows, in mining order
+        """
+        start_indexes = list()
+
+        for window_index in self._anomalous_windows:
             for current_lag_val in range(self._lag, -1, -1):
 
                 # formulating patterns by defining indexes
@@ -43,20 +328,76 @@ class PatternMiner:
                 end_pattern_index = start_pattern_index + self._pattern_length
 
                 if self._is_valid_seq(start_pattern_index, end_pattern_index):
-                    valid_seq_count += 1
-
                     # Adding indexes to visited
                     self._visited_indexes.add(
                         (start_pattern_index, end_pattern_index))
+                    start_indexes.append(start_pattern_index)
 
-                    # Prune and enumerate patterns
-                    saved_enumerations += self._pruning_inst.prune_and_enumerate_patterns(
-                        start_pattern_index, end_pattern_index)
+        return start_indexes
 
-        # Calculating computations saved
-        total_patterns = valid_seq_count * (2 ** self._num_of_dims - 1)
-        message = 'Completed Mining, Pattern Enumerations saved: ({0} / {1})'
-        print_fun(message.format(saved_enumerations, total_patterns))
+    def _drop_duplicate_segments(self, start_indexes: list) -> tuple:
+        """Summary
+            keeps the first window of every distinct data segment (same window ids in all
+        dimensions), later ones have every pattern of their lattice already enumerated.
+        Also returns the kept window standing for each window
+        """
+        if len(start_indexes) == 0:
+            return start_indexes, start_indexes
+
+        segment_ids = self._pruning_inst.get_segment_ids(start_indexes)
+        _, first_rows, segment_rows = np.unique(segment_ids, axis=0, return_index=True,
+                                                return_inverse=True)
+        representative_indexes = np.asarray(start_indexes)[
+            first_rows[segment_rows.reshape(-1)]].tolist()
+
+        return [start_indexes[i] for i in np.sort(first_rows)], representative_indexes
+
+    def _can_mine_parallel(self) -> bool:
+        """Summary
+            parallel mining needs an order independent pruning strategy (for output
+        identical to serial mining) and forked worker processes
+        """
+        if not self._pruning_inst.is_order_independent:
+            print_fun('Pruning strategy depends on enumeration order, mining serially')
+            return False
+
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            print_fun('Worker processes can not be forked, mining serially')
+            return False
+
+        return True
+
+    def _mine_parallel(self, start_indexes: list) -> None:
+        """Summary
+            Mines contiguous chunks of windows in forked worker processes, each with its
+        own enumeration, merged in chunk order with dedup by pattern key. As pruning does
+        not depend on the order of enumeration, the merge equals serial mining
+        """
+        # every pattern is enumerated once, all other nodes are saved
+        num_of_nodes = 2 ** self._num_of_dims - 1
+        chunks = [x.tolist() for x in np.array_split(
+            start_indexes, min(len(start_indexes), self._n_jobs * chunks_per_job))]
+
+        _worker_state.update(pattern_length=self._pattern_length,
+                             pruning_inst=self._pruning_inst,
+                             enum_pattern_inst=self._enum_pattern_inst)
+        try:
+            with multiprocessing.get_context('fork').Pool(self._n_jobs) as pool:
+                for chunk, (num_of_pruned_nodes, exported_patterns) in tqdm(
+                        zip(chunks, pool.imap(_mine_windows, chunks)), total=len(chunks)):
+                    # stopping between chunks, later chunks are terminated
+                    if self._is_stop_requested():
+                        break
+
+                    num_of_patterns = self._enum_pattern_inst.num_of_patterns
+                    self._pruning_inst.num_of_pruned_nodes += num_of_pruned_nodes
+                    self._enum_pattern_inst.merge_patterns(*exported_patterns)
+                    self._saved_enumerations += len(chunk) * num_of_nodes - (
+                        self._enum_pattern_inst.num_of_patterns - num_of_patterns)
+                    self.num_of_mined_windows += len(chunk)
+                    self._save_checkpoint_if_due()
+        finally:
+            _worker_state.clear()
 
     def _is_valid_seq(self, start_idx: int, end_idx: int) -> bool:
         """Summary
@@ -65,7 +406,6 @@ class PatternMiner:
             2. Out of bounds
             3. Across any of violated indexes
         """
-        # Most elegant and fast solution
         if start_idx < 0:
             return False
 
@@ -75,16 +415,23 @@ class PatternMiner:
         if (start_idx, end_idx) in self._visited_indexes:
             return False
 
-        def BinarySearch(a: list, x) -> int:
-            i = bisect_left(a, x)
-            if i != len(a) and a[i] == x:
-                return i
-            else:
-                return -1
+        return not self._segment_boundaries.crosses(start_idx, end_idx)
 
-        if len(self._invalid_seq_indexes) > 0:
-            for i in range(start_idx + 1, end_idx):
-                if BinarySearch(self._invalid_seq_indexes, i) != -1:
-                    return False
+def _mine_windows(start_indexes: list) -> tuple:
+    """Summary
+        Worker: mines a chunk of windows into a fresh enumeration, returns the count of
+    nodes pruned and the exported patterns
+    """
+    pattern_length = _worker_state['pattern_length']
+    pruning_inst = _worker_state['pruning_inst']
+    enum_pattern_inst = _worker_state['enum_pattern_inst']
 
-        return True
+    enum_pattern_inst.reset()
+    num_of_pruned_nodes = pruning_inst.num_of_pruned_nodes
+
+    for start_pattern_index in start_indexes:
+        pruning_inst.prune_and_enumerate_patterns(
+            start_pattern_index, start_pattern_index + pattern_length)
+
+    return (pruning_inst.num_of_pruned_nodes - num_of_pruned_nodes,
+            enum_pattern_inst.export_patterns())
@@ -1,15 +1,54 @@
-import pandas as pd
 from abc import ABCMeta, abstractmethod
+import numpy as np
+
+from ..mining import BitmaskLattice, LazyLattice
+
+# Specific constant: above these many dimensions, the lattice is always generated lazily
+max_bitmask_dims = 20
 
 class PruningStrategy(metaclass=ABCMeta):
 
+    # if patterns enumerated (and nodes pruned) per window do not depend upon the
+    # patterns enumerated before, windows can be mined in any order / in parallel
+    is_order_independent = False
+
     @abstractmethod
     def prune_and_enumerate_patterns(self, start_index: int, end_index: int) -> list:
         pass
 
-    def _reconstruct_pattern_df(self, start_index: int, end_index: int,
-                                column_indexes: list) -> pd.DataFrame:
+    def get_config(self) -> dict:
+        """Summary
+            pruning settings, the data as fingerprint of the pattern count index
+        """
+        return {'pruning_type': type(self).__name__,
+                'data': self._pattern_count_inst.get_fingerprint()}
+
+    def get_state(self) -> dict:
+        """Summary
+            state carried from one window to the next, as arrays (for checkpoints)
+        """
+        # a string, counts of nodes beyond 63 dimensions do not fit an int64
+        return {'num_of_pruned_nodes': np.array(str(self.num_of_pruned_nodes))}
+
+    def set_state(self, state: dict) -> None:
+        """Summary
+            restores a state taken with get_state
+        """
+        self.num_of_pruned_nodes = int(str(state['num_of_pruned_nodes']))
+
+    def get_segment_ids(self, start_indexes: list):
         """Summary
-            uses information provided as arguments to slice and index specific parts of dataframe
+            identity of the data segment (all dimensions) starting at each index
         """
-        return self._data[self._data.columns[column_indexes]].iloc[start_index: end_index]
+        return self._pattern_count_inst.get_segment_ids(start_indexes)
+
+    @staticmethod
+    def _create_lattice(num_of_dims: int, lazy_lattice: bool):
+        """Summary
+            array backed lattice of all subsets, or a lazily generated one (level-wise
+        from surviving nodes) for high dimensional data
+        """
+        if lazy_lattice or num_of_dims > max_bitmask_dims:
+            return LazyLattice(num_of_dims)
+
+        return BitmaskLattice(num_of_dims)
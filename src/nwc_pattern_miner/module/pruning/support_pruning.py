@@ -1,10 +1,10 @@
 # Apriori algorithm, uses support of lower nodes to prune parent nodes and prevent enumeration
 import pandas as pd
 
-from ..utilities import stringify_dataframe
+from ..utilities import get_pattern_key
 from .pruning_strategy import PruningStrategy
-from ..patterncount import PatternCountStrategy
-from ..mining import EnumeratedPattern, LatticeGraph
+from ..patterncount import PatternCountStrategy, VerticalOccurences
+from ..mining import EnumeratedPattern
 
 # Specific constant
 prune_type = 'parents'
@@ -12,25 +12,28 @@ threshold_metric = 'support'
 
 class SupportPruning(PruningStrategy):
 
+    # already enumerated patterns are only skipped, pruning depends on support alone
+    is_order_independent = True
+
     def __init__(self, num_of_dims: int, data: pd.DataFrame,
                  enum_pattern_inst: EnumeratedPattern,
                  pattern_count_inst: PatternCountStrategy,
-                 threshold_value: float) -> None:
+                 threshold_value: float, lazy_lattice: bool = False) -> None:
 
         self._data = data
-        self._data_values = data.values
         self._num_of_dims = num_of_dims
         self._threshold_value = threshold_value
         self._enum_pattern_inst = enum_pattern_inst
         self._pattern_count_inst = pattern_count_inst
+        self._vertical_occurences_inst = VerticalOccurences(pattern_count_inst)
+        self._lattice_inst = self._create_lattice(num_of_dims, lazy_lattice)
+        self.num_of_pruned_nodes = 0
 
-    def _reconstruct_pattern_df(self, start_index: int, end_index: int,
-                                column_indexes: list) -> pd.DataFrame:
-        """Summary
-            uses information provided as arguments to slice and index specific parts of dataframe
-        """
-        return pd.DataFrame(self._data_values[start_index:end_index, column_indexes],
-                            columns=self._data.columns[column_indexes])
+    def get_config(self) -> dict:
+        config = super().get_config()
+        config['support_threshold'] = float(self._threshold_value)
+
+        return config
 
     def prune_and_enumerate_patterns(self, start_index: int, end_index: int) -> list:
         """Summary
@@ -40,53 +43,49 @@ class SupportPruning(PruningStrategy):
             2. If a pattern is below threshold, prune it's parents following apriori
             3. No need to store pruning information of a pattern as it already enumerated
         """
-        lattice_graph_inst = LatticeGraph(self._num_of_dims)
+        lattice_inst = self._lattice_inst
+        lattice_inst.reset()
+        window_ids = self._pattern_count_inst.get_window_ids(start_index)
+        self._vertical_occurences_inst.reset(window_ids)
 
         nodes_enumerated = 0
-        lattice_graph = lattice_graph_inst.get_graph()
-
-        for level, nodes_per_level in sorted(lattice_graph.items(), reverse=True):
-            entire_level_pruned = True
-
-            for node_dimensions, latticenode_inst in nodes_per_level.items():
-
-                # a. check if node is pruned, if yes, move to next node
-                if latticenode_inst.is_node_pruned():
-                    continue
-
-                # b. would need to reconstruct the pattern dataframe from indexes, to enumerate
-                pattern_df = self._reconstruct_pattern_df(
-                    start_index, end_index, list(node_dimensions))
-
-                # c. check if pattern already enumerated, if not then enumerate
-                pattern_str = stringify_dataframe(pattern_df)
-                pattern_index = self._enum_pattern_inst.find_pattern(
-                    pattern_str)
-
-                if pattern_index == -1:
-                    # finding pattern occurences
-                    pattern_occurences = self._pattern_count_inst.find_pattern_occurences(
-                        pattern_df)
-
-                    # pattern enumeration (counting cooccurences and other metrics)
-                    self._enum_pattern_inst.enumerate_pattern(
-                        pattern_str, pattern_occurences)
-
-                    # Counting nodes enumerated
-                    nodes_enumerated += 1
-
-                # d. Now that pattern is enumerated, we have threshold information about it
-                # two conditions for pruning parent patterns (hashing and apriori)
-                if not self._enum_pattern_inst.is_above_threshold(pattern_index,
-                                                                  threshold_metric,
-                                                                  self._threshold_value):
-                    # pruning all parents if node not above
-                    lattice_graph_inst.prune_nodes_recursively(
-                        level, node_dimensions, prune_type)
-                else:
-                    entire_level_pruned = False
-
-            if entire_level_pruned:
+
+        for level in range(self._num_of_dims - 1, -1, -1):
+
+            # a. nodes not pruned yet, and compact keys of their patterns
+            # (dimensions and their window ids)
+            level_masks = [x for x in lattice_inst.get_level(level)
+                           if not lattice_inst.is_node_pruned(x)]
+            pattern_keys = [get_pattern_key(window_ids, lattice_inst.get_dimensions(x))
+                            for x in level_masks]
+
+            # b. enumerate patterns not already enumerated, as one batch (nodes of a level
+            # never prune each other, so the level is enumerated before any pruning)
+            new_nodes = [i for i, pattern_key in enumerate(pattern_keys)
+                         if self._enum_pattern_inst.find_pattern(pattern_key) == -1]
+
+            # finding pattern occurences (from occurences of their subpatterns)
+            self._enum_pattern_inst.enumerate_patterns(
+                [pattern_keys[i] for i in new_nodes],
+                [self._vertical_occurences_inst.get_occurences(level_masks[i])
+                 for i in new_nodes])
+
+            # Counting nodes enumerated
+            nodes_enumerated += len(new_nodes)
+
+            # c. Now that patterns are enumerated, we have threshold information about them
+            # two conditions for pruning parent patterns (hashing and apriori)
+            pattern_indexes = [self._enum_pattern_inst.find_pattern(x) for x in pattern_keys]
+            are_above = self._enum_pattern_inst.are_above_threshold(
+                pattern_indexes, threshold_metric, self._threshold_value)
+
+            for node_mask, is_above in zip(level_masks, are_above):
+                # pruning all parents if node not above
+                if not is_above:
+                    self.num_of_pruned_nodes += lattice_inst.prune_nodes(
+                        node_mask, prune_type)
+
+            if not are_above.any():
                 break
 
-        return (lattice_graph_inst.num_of_nodes - nodes_enumerated)
+        return (lattice_inst.num_of_nodes - nodes_enumerated)
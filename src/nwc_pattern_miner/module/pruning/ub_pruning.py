@@ -1,11 +1,13 @@
 # Apriori algorithm, uses support of lower nodes to prune parent nodes and prevent enumeration
 import sys
+import heapq
+import numpy as np
 import pandas as pd
 
-from ..utilities import stringify_dataframe
-from .pruning_strategy import PruningStrategy
-from ..patterncount import PatternCountStrategy
-from ..mining import EnumeratedPattern, LatticeGraph
+from ..utilities import get_pattern_key
+from .pruning_strategy import PruningStrategy, max_bitmask_dims
+from ..patterncount import PatternCountStrategy, VerticalOccurences
+from ..mining import EnumeratedPattern
 
 # Specific constant
 max_type = 'max'
@@ -21,82 +23,142 @@ class UBPruning(PruningStrategy):
                  enum_pattern_inst: EnumeratedPattern,
                  pattern_count_inst: PatternCountStrategy,
                  threshold_support_value: float,
-                 threshold_crossk_value: float) -> None:
+                 threshold_crossk_value: float, lazy_lattice: bool = False,
+                 topk: int = -1) -> None:
+        """Summary
+            topk: k of an output ranked by crossk, if provided the crossk threshold of UB
+        pruning rises to the k-th best crossk (of patterns above the support threshold)
+        enumerated so far, as no pattern below it can make the output.
+        The top-down walk enumerates every subset down the lattice (UB pruning only
+        prunes supersets), exponential in the number of dimensions, so it is refused
+        above max_bitmask_dims dimensions (where the lattice is generated lazily)
+        """
+        if num_of_dims > max_bitmask_dims:
+            raise Exception('UB pruning is not supported above {0} dimensions, use apriori '
+                            'pruning'.format(max_bitmask_dims))
 
         self._data = data
-        self._data_values = data.values
         self._num_of_dims = num_of_dims
         self._threshold_support_value = threshold_support_value
         self._threshold_crossk_value = threshold_crossk_value
         self._enum_pattern_inst = enum_pattern_inst
         self._crossk_const = enum_pattern_inst._crossk_const
         self._pattern_count_inst = pattern_count_inst
+        self._vertical_occurences_inst = VerticalOccurences(pattern_count_inst)
         self._singleton_joint_counts = dict()
+        self._lattice_inst = self._create_lattice(num_of_dims, lazy_lattice)
+        self.num_of_pruned_nodes = 0
+        self._topk = topk
+        self._topk_crossk_values = list()
+
+    def get_config(self) -> dict:
+        config = super().get_config()
+        config.update(support_threshold=float(self._threshold_support_value),
+                      crossk_threshold=float(self._threshold_crossk_value),
+                      topk=int(self._topk))
+
+        return config
+
+    def get_state(self) -> dict:
+        """Summary
+            also joint counts of singletons and the top-k crossk values, both carried
+        across windows
+        """
+        state = super().get_state()
+        state['singleton_dims'] = np.array(list(self._singleton_joint_counts.keys()),
+                                           dtype=np.int64)
+        state['singleton_joint_counts'] = np.array(
+            list(self._singleton_joint_counts.values()), dtype=np.int64)
+        state['topk_crossk_values'] = np.array(self._topk_crossk_values, dtype=np.float64)
+
+        return state
+
+    def set_state(self, state: dict) -> None:
+        super().set_state(state)
+        self._singleton_joint_counts = dict(zip(state['singleton_dims'].tolist(),
+                                                state['singleton_joint_counts'].tolist()))
+        self._topk_crossk_values = state['topk_crossk_values'].tolist()
+
+    def _get_crossk_threshold(self) -> float:
+        """Summary
+            crossk threshold for UB pruning, the k-th best crossk once k patterns rank
+        """
+        if self._topk > 0 and len(self._topk_crossk_values) == self._topk:
+            return max(self._threshold_crossk_value, self._topk_crossk_values[0])
 
-    def _reconstruct_pattern_df(self, start_index: int, end_index: int,
-                                column_indexes: list) -> pd.DataFrame:
+        return self._threshold_crossk_value
+
+    def _rank_new_patterns(self, pattern_indexes: list) -> None:
         """Summary
-            uses information provided as arguments to slice and index specific parts of dataframe
+            keeps the k best crossk values (min heap) among newly enumerated patterns above
+        the support threshold, i.e. patterns ranked for the output
         """
-        return pd.DataFrame(self._data_values[start_index:end_index, column_indexes],
-                            columns=self._data.columns[column_indexes])
+        if self._topk <= 0 or len(pattern_indexes) == 0:
+            return
+
+        is_ranked = self._enum_pattern_inst.get_pattern_values(
+            'above_some_threshold')[pattern_indexes]
+        crossk_values = self._enum_pattern_inst.get_pattern_values(
+            crossk_metric)[pattern_indexes][is_ranked]
+
+        for crossk_value in crossk_values[~np.isnan(crossk_values)].tolist():
+            if len(self._topk_crossk_values) < self._topk:
+                heapq.heappush(self._topk_crossk_values, crossk_value)
+            elif crossk_value > self._topk_crossk_values[0]:
+                heapq.heapreplace(self._topk_crossk_values, crossk_value)
 
-    def _apriori_pruning(self, start_index: int, end_index: int,
-                         lattice_graph_inst: LatticeGraph, level: int) -> None:
+    def _apriori_pruning(self, window_ids: list, level: int) -> None:
         """Summary
             To prune patterns using support / apriori bottom up
         Args:
-            start_index (int): start index of pattern
-            end_index (int): end index of pattern
+            window_ids (list): window id of every dimension at the pattern's start index
             level (int): Level in the lattice graph
         """
-        nodes_enumerated = 0
-        entire_level_pruned = True
-        nodes_per_level = lattice_graph_inst.get_graph()[level]
+        lattice_inst = self._lattice_inst
 
-        for node_dimensions, latticenode_inst in nodes_per_level.items():
+        # a. nodes not pruned yet, and compact keys of their patterns
+        # (dimensions and their window ids)
+        level_masks = [x for x in lattice_inst.get_level(level)
+                       if not lattice_inst.is_node_pruned(x)]
+        pattern_keys = [get_pattern_key(window_ids, lattice_inst.get_dimensions(x))
+                        for x in level_masks]
 
-            # a. check if node is pruned, if yes, move to next node
-            if latticenode_inst.is_node_pruned():
-                continue
+        # b. enumerate patterns not already enumerated, as one batch
+        new_nodes = [i for i, pattern_key in enumerate(pattern_keys)
+                     if self._enum_pattern_inst.find_pattern(pattern_key) == -1]
 
-            # b. would need to reconstruct the pattern dataframe from indexes, to enumerate
-            pattern_df = self._reconstruct_pattern_df(
-                start_index, end_index, list(node_dimensions))
+        # finding pattern occurences (from occurences of their subpatterns)
+        self._enum_pattern_inst.enumerate_patterns(
+            [pattern_keys[i] for i in new_nodes],
+            [self._vertical_occurences_inst.get_occurences(level_masks[i]) for i in new_nodes])
 
-            # c. check if pattern already enumerated, if not then enumerate
-            pattern_str = stringify_dataframe(pattern_df)
-            pattern_index = self._enum_pattern_inst.find_pattern(
-                pattern_str)
+        # Counting nodes enumerated
+        nodes_enumerated = len(new_nodes)
 
-            if pattern_index == -1:
-                # finding pattern occurences
-                pattern_occurences = self._pattern_count_inst.find_pattern_occurences(
-                    pattern_df)
+        pattern_indexes = [self._enum_pattern_inst.find_pattern(x) for x in pattern_keys]
 
-                # pattern enumeration (counting cooccurences and other metrics)
-                self._enum_pattern_inst.enumerate_pattern(
-                    pattern_str, pattern_occurences)
+        # Storing joint counts of singletons / leaves
+        joinset_cardinality = self._enum_pattern_inst.get_pattern_values('joinset_cardinality')
+        for node_mask, pattern_index in zip(level_masks, pattern_indexes):
+            node_dimensions = lattice_inst.get_dimensions(node_mask)
+            if len(node_dimensions) == 1:
+                self._singleton_joint_counts[node_dimensions[0]] = int(
+                    joinset_cardinality[pattern_index])
 
-                # Counting nodes enumerated
-                nodes_enumerated += 1
+        # c. Now that patterns are enumerated, we have threshold information about them
+        # two conditions for pruning parent patterns (hashing and apriori)
+        are_above = self._enum_pattern_inst.are_above_threshold(
+            pattern_indexes, support_metric, self._threshold_support_value)
 
-            # Storing joint counts of singletons / leaves
-            if len(node_dimensions) == 1:
-                leaf_joinset_count = self._enum_pattern_inst._joinset_cardinality[pattern_index]
-                self._singleton_joint_counts[node_dimensions[0]
-                                             ] = leaf_joinset_count
-
-            # d. Now that pattern is enumerated, we have threshold information about it
-            # two conditions for pruning parent patterns (hashing and apriori)
-            if not self._enum_pattern_inst.is_above_threshold(pattern_index,
-                                                              support_metric,
-                                                              self._threshold_support_value):
-                # pruning all parents if node not above
-                lattice_graph_inst.prune_nodes_recursively(
-                    level, node_dimensions, parent_prune_type)
-            else:
-                entire_level_pruned = False
+        self._rank_new_patterns([pattern_indexes[i] for i in new_nodes])
+
+        for node_mask, is_above in zip(level_masks, are_above):
+            # pruning all parents if node not above
+            if not is_above:
+                self.num_of_pruned_nodes += lattice_inst.prune_nodes(
+                    node_mask, parent_prune_type)
+
+        entire_level_pruned = not are_above.any()
 
         return nodes_enumerated, entire_level_pruned
 
@@ -121,47 +183,45 @@ class UBPruning(PruningStrategy):
 
         return joint_count
 
-    def _upperbound_pruning(self, start_index: int, end_index: int,
-                            lattice_graph_inst: LatticeGraph, level: int) -> None:
+    def _upperbound_pruning(self, window_ids: list, level: int) -> None:
         """Summary
             UB based pruning top down
         Args:
-            start_index (int): Description
-            end_index (int): Description
-            lattice_graph_inst (LatticeGraph): Description
+            window_ids (list): window id of every dimension at the pattern's start index
             level (int): Description
         """
         nodes_enumerated = 0
         stop_execution = False
-        nodes_per_level = lattice_graph_inst.get_graph()[level]
+        lattice_inst = self._lattice_inst
 
-        for node_dimensions, latticenode_inst in nodes_per_level.items():
+        for node_mask in lattice_inst.get_level(level):
 
             # a. check if node is pruned, if yes, move to next node
-            if latticenode_inst.is_node_pruned():
+            if lattice_inst.is_node_pruned(node_mask):
                 continue
 
+            node_dimensions = lattice_inst.get_dimensions(node_mask)
+            superpattern_count = lattice_inst.get_superpattern_count(node_mask)
+
             # b. check not root, then calculate UBmax and UBmin before pattern expansion
             if level != 0:
                 max_leaf_count = self._get_joint_singleton_count(
                     node_dimensions, max_type)
                 ub_max = self._crossk_const * \
-                    (max_leaf_count / latticenode_inst.superpattern_count)
+                    (max_leaf_count / superpattern_count)
 
-                if ub_max > 0 and ub_max < self._threshold_crossk_value:
+                if ub_max > 0 and ub_max < self._get_crossk_threshold():
                     # prune all children of current node
-                    lattice_graph_inst.prune_nodes_recursively(
-                        level, node_dimensions, parent_prune_type)
+                    self.num_of_pruned_nodes += lattice_inst.prune_nodes(
+                        node_mask, parent_prune_type)
                     continue
 
-            # c. else would need to reconstruct the pattern dataframe from indexes, to enumerate
-            pattern_df = self._reconstruct_pattern_df(
-                start_index, end_index, list(node_dimensions))
+            # c. else would need the compact key of the pattern, to enumerate
+            pattern_key = get_pattern_key(window_ids, node_dimensions)
 
             # d. check if pattern already enumerated, if yes, then prune all children
-            pattern_str = stringify_dataframe(pattern_df)
             pattern_index = self._enum_pattern_inst.find_pattern(
-                pattern_str)
+                pattern_key)
             if pattern_index != -1:
                 # step different from apriori pruning as (children can have different parents,
                 # but a parent would have exact same children)
@@ -174,29 +234,30 @@ class UBPruning(PruningStrategy):
                     return nodes_enumerated, stop_execution
 
                 # else just prune children of the current node
-                lattice_graph_inst.prune_nodes_recursively(
-                    level, node_dimensions, parent_prune_type)
+                self.num_of_pruned_nodes += lattice_inst.prune_nodes(
+                    node_mask, parent_prune_type)
                 continue
 
             # till here means node either root, not enumerated or UBmax > threshold
             # e. Any of the above cases, would have to count and enumerate the pattern,
             # finding pattern occurences
-            pattern_occurences = self._pattern_count_inst.find_pattern_occurences(
-                pattern_df)
+            pattern_occurences = self._pattern_count_inst.find_key_occurences(
+                pattern_key)
             # pattern enumeration (counting cooccurences and other metrics)
             self._enum_pattern_inst.enumerate_pattern(
-                pattern_str, pattern_occurences)
+                pattern_key, pattern_occurences)
             # Counting nodes enumerated
             nodes_enumerated += 1
 
-            # f. update if pattern above support and crossk-threshold (return T/F)
-            self._enum_pattern_inst.is_above_threshold(
-                -1, crossk_metric, self._threshold_crossk_value)
+            # f. update if pattern above support-threshold (return T/F), the flag (and
+            # occurence ranking) is set once, crossk-threshold only prunes via UBmax
             self._enum_pattern_inst.is_above_threshold(
                 -1, support_metric, self._threshold_support_value)
+            self._rank_new_patterns([self._enum_pattern_inst.num_of_patterns - 1])
 
             # g. obtain current pattern count
-            curr_pattern_count = self._enum_pattern_inst._patterncount[-1]
+            curr_pattern_count = int(
+                self._enum_pattern_inst.get_pattern_values('patterncount')[-1])
 
             # h. If the node is root, check UBmax
             if level == 0:
@@ -204,22 +265,19 @@ class UBPruning(PruningStrategy):
                 ub_max = self._crossk_const * \
                     (max_leaf_count / curr_pattern_count)
 
-                if ub_max < self._threshold_crossk_value:
+                if ub_max < self._get_crossk_threshold():
                     # entire lattice pruned
                     stop_execution = True
                     return nodes_enumerated, stop_execution
 
             # i. If continued till here, transfer the superpattern counts to the children
             bigger_count = curr_pattern_count
-            if bigger_count < latticenode_inst.superpattern_count:
-                bigger_count = latticenode_inst.superpattern_count
-
-            for child_dimensions in latticenode_inst.get_children():
-                latticechild_inst = lattice_graph_inst.get_node(
-                    level + 1, child_dimensions)
+            if bigger_count < superpattern_count:
+                bigger_count = superpattern_count
 
-                if latticechild_inst.superpattern_count < bigger_count:
-                    latticechild_inst.superpattern_count = bigger_count
+            for child_mask in lattice_inst.get_children(node_mask):
+                if lattice_inst.get_superpattern_count(child_mask) < bigger_count:
+                    lattice_inst.set_superpattern_count(child_mask, bigger_count)
 
         return nodes_enumerated, stop_execution
 
@@ -232,7 +290,9 @@ class UBPruning(PruningStrategy):
             to the children
             4. Use Apriori to prune while bottom-up traversal
         """
-        lattice_graph_inst = LatticeGraph(self._num_of_dims)
+        self._lattice_inst.reset()
+        window_ids = self._pattern_count_inst.get_window_ids(start_index)
+        self._vertical_occurences_inst.reset(window_ids)
 
         topmost_level = 0
         stop_execution = False
@@ -244,7 +304,7 @@ class UBPruning(PruningStrategy):
 
             # bottom-up
             nodes_enumerated, stop_execution = self._apriori_pruning(
-                start_index, end_index, lattice_graph_inst, bottomost_level)
+                window_ids, bottomost_level)
 
             bottomost_level -= 1
             total_nodes_enumerated += nodes_enumerated
@@ -252,9 +312,9 @@ class UBPruning(PruningStrategy):
             # top-down
             if topmost_level <= bottomost_level and not stop_execution:
                 nodes_enumerated, stop_execution = self._upperbound_pruning(
-                    start_index, end_index, lattice_graph_inst, topmost_level)
+                    window_ids, topmost_level)
 
                 topmost_level += 1
                 total_nodes_enumerated += nodes_enumerated
 
-        return (lattice_graph_inst.num_of_nodes - total_nodes_enumerated)
+        return (self._lattice_inst.num_of_nodes - total_nodes_enumerated)
@@ -1,5 +1,5 @@
 # Contains common utility functions
-import pandas as pd
+import numpy as np
 
 
 def print_fun(message: str, status: str = '') -> None:
@@ -14,12 +14,95 @@ def print_fun(message: str, status: str = '') -> None:
     print(custom_msg.format(message, separator))
 
 
-def stringify_dataframe(data: pd.DataFrame, start_idx: int = -1, end_idx: int = -1) -> str:
+def dimensions_to_mask(dimensions: tuple) -> int:
     """Summary
-        Used to stringify dataframes for hashing
+        Encodes a set of dimension indexes as a bitmask
     """
-    # If need to stringify complete dataframe
-    if start_idx != -1:
-        data = data.iloc[start_idx: end_idx]
+    mask = 0
+    for dim in dimensions:
+        mask |= 1 << dim
 
-    return data.to_json(orient='records')
+    return mask
+
+
+def mask_to_dimensions(mask: int) -> tuple:
+    """Summary
+        Decodes a bitmask to its dimension indexes (ascending)
+    """
+    dimensions = list()
+    dim = 0
+    while mask:
+        if mask & 1:
+            dimensions.append(dim)
+        mask >>= 1
+        dim += 1
+
+    return tuple(dimensions)
+
+
+def get_pattern_key(window_ids: list, dimensions: tuple) -> tuple:
+    """Summary
+        Compact pattern identity: (dimension bitmask, window id of each dimension)
+    Args:
+        window_ids (list): window id of every dimension at the pattern's start index
+        dimensions (tuple): dimension indexes (ascending) involved in the pattern
+    """
+    return (dimensions_to_mask(dimensions), tuple(window_ids[dim] for dim in dimensions))
+
+
+class SegmentBoundaries:
+
+    def __init__(self, invalid_seq_indexes, num_of_readings: int) -> None:
+        """Summary
+            Breaks in the series (reading i is not continuous with reading i - 1), as
+        counts of breaks before every index, for O(1) range checks
+        Args:
+            invalid_seq_indexes: list / array of break indexes, or a boolean mask (column)
+            num_of_readings (int): length of the series
+        """
+        invalid_seq_indexes = np.asarray(invalid_seq_indexes)
+        if invalid_seq_indexes.dtype == bool:
+            invalid_seq_indexes = np.flatnonzero(invalid_seq_indexes)
+
+        invalid_seq_indexes = invalid_seq_indexes.astype(np.int64)
+        invalid_seq_indexes = invalid_seq_indexes[
+            (invalid_seq_indexes >= 0) & (invalid_seq_indexes <= num_of_readings)]
+
+        is_break = np.zeros(num_of_readings + 1, dtype=np.int64)
+        is_break[invalid_seq_indexes] = 1
+
+        self._num_of_readings = num_of_readings
+        self._break_counts = np.zeros(num_of_readings + 2, dtype=np.int64)
+        np.cumsum(is_break, out=self._break_counts[1:])
+
+    def get_break_counts(self) -> np.ndarray:
+        return self._break_counts
+
+    def crosses(self, start_idx: int, end_idx: int) -> bool:
+        """Summary
+            if segment [start_idx, end_idx) spans any break (a break at start_idx is not
+        crossed)
+        """
+        return bool(self._break_counts[end_idx] > self._break_counts[start_idx + 1])
+
+    def crosses_all(self, start_indexes: np.ndarray, end_indexes: np.ndarray) -> np.ndarray:
+        """Summary
+            crosses, for arrays of segments
+        """
+        return self._break_counts[end_indexes] > self._break_counts[start_indexes + 1]
+
+    def get_segment_ends(self) -> np.ndarray:
+        """Summary
+            end index (exclusive) of the segment containing each reading
+        """
+        segments = self.get_segments()
+        return np.repeat([y for x, y in segments], [y - x for x, y in segments]).astype(np.int64)
+
+    def get_segments(self) -> list:
+        """Summary
+            continuous segments of the series, as (start index, end index) pairs
+        """
+        break_indexes = np.flatnonzero(np.diff(self._break_counts))
+        bounds = np.unique(np.concatenate([[0], break_indexes, [self._num_of_readings]]))
+
+        return [(int(x), int(y)) for x, y in zip(bounds[:-1], bounds[1:])]
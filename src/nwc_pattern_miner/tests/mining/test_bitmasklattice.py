@@ -0,0 +1,40 @@
+import unittest
+from module.mining import BitmaskLattice, LatticeGraph
+from module.utilities import dimensions_to_mask
+
+
+class TestBitmaskLattice(unittest.TestCase):
+    num_of_dims = 4
+    lattice_inst = BitmaskLattice(num_of_dims)
+
+    def test_levels_match_lattice_graph(self):
+        lattice_graph = LatticeGraph(self.num_of_dims).get_graph()
+
+        for depth, nodes_per_level in lattice_graph.items():
+            expected_masks = [dimensions_to_mask(x) for x in nodes_per_level]
+            self.assertListEqual(self.lattice_inst.get_level(depth), expected_masks)
+
+    def test_parents_and_children(self):
+        self.assertListEqual(self.lattice_inst.get_parents(0b0101), [0b0111, 0b1101])
+        self.assertListEqual(self.lattice_inst.get_children(0b0101), [0b0100, 0b0001])
+        self.assertListEqual(self.lattice_inst.get_children(0b0100), [])
+
+    def test_prune_and_reset(self):
+        self.lattice_inst.reset()
+        num_of_pruned_nodes = self.lattice_inst.prune_nodes(0b0001, 'parents')
+
+        pruned_masks = [x for x in range(1, 16) if self.lattice_inst.is_node_pruned(x)]
+        self.assertEqual(num_of_pruned_nodes, 8)
+        self.assertListEqual(pruned_masks, [x for x in range(1, 16) if x & 0b0001])
+
+        # only newly pruned nodes are counted
+        self.assertEqual(self.lattice_inst.prune_nodes(0b0011, 'parents'), 0)
+        self.assertEqual(self.lattice_inst.prune_nodes(0b0110, 'children'), 3)
+        self.assertEqual(self.lattice_inst.prune_nodes(0b1010, 'parents'), 2)
+
+        self.lattice_inst.reset()
+        self.assertFalse(any(self.lattice_inst.is_node_pruned(x) for x in range(1, 16)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,10 @@
 import unittest
 import numpy as np
 import pandas as pd
-from module.utilities import stringify_dataframe
-from module.patterncount import SequenceMap
+from module.utilities import get_pattern_key
+from module.patterncount import SequenceMap, OccurenceSet
 from module.mining import EnumeratedPattern
+from module.mining.candidatepattern import _get_topk_indexes
 
 class TestEnumeratedPattern(unittest.TestCase):
 
@@ -19,10 +20,6 @@ class TestEnumeratedPattern(unittest.TestCase):
     seqmap_inst = SequenceMap(engine_data, 'ncwindow')
     seqmap_inst.init_seq_map(pattern_length)
 
-    # Enumerating a pattern
-    dimensions = ['engrpm', 'brkpw']
-    pattern_df = engine_data[dimensions].iloc[1:3]
-
     # Instantiating Enumeration of patterns
     lag = 1
     num_of_readings = 9
@@ -30,48 +27,27 @@ class TestEnumeratedPattern(unittest.TestCase):
     enum_patterns_inst = EnumeratedPattern(
         anomalous_windows, num_of_readings, lag)
 
-    # Enumerating patterns
-    test_pattern_str = stringify_dataframe(pattern_df)
-    pattern_occurences = seqmap_inst.find_pattern_occurences(pattern_df)
-    enum_patterns_inst.enumerate_pattern(
-        test_pattern_str, pattern_occurences)
-
-    dimensions = ['engrpm', 'brkpw', 'nox']
-    pattern_df = engine_data[dimensions].iloc[1:3]
-    pattern_str = stringify_dataframe(pattern_df)
-    pattern_occurences = seqmap_inst.find_pattern_occurences(pattern_df)
-    enum_patterns_inst.enumerate_pattern(pattern_str, pattern_occurences)
-
-    dimensions = ['nox']
-    pattern_df = engine_data[dimensions].iloc[4:6]
-    test_pattern_str_2 = stringify_dataframe(pattern_df)
-    pattern_occurences = seqmap_inst.find_pattern_occurences(pattern_df)
-    enum_patterns_inst.enumerate_pattern(
-        test_pattern_str_2, pattern_occurences)
-
-    dimensions = ['brkpw']
-    pattern_df = engine_data[dimensions].iloc[2:4]
-    pattern_str = stringify_dataframe(pattern_df)
-    pattern_occurences = seqmap_inst.find_pattern_occurences(pattern_df)
-    enum_patterns_inst.enumerate_pattern(pattern_str, pattern_occurences)
-
-    dimensions = ['nox', 'brkpw']
-    pattern_df = engine_data[dimensions].iloc[7:9]
-    pattern_str = stringify_dataframe(pattern_df)
-    pattern_occurences = seqmap_inst.find_pattern_occurences(pattern_df)
-    enum_patterns_inst.enumerate_pattern(pattern_str, pattern_occurences)
+    # Enumerating patterns (start index, dimensions), keyed by compact pattern keys
+    pattern_keys = list()
+    for start_index, dimensions in [(1, (0, 1)), (1, (0, 1, 2)), (4, (2,)),
+                                    (2, (1,)), (7, (1, 2))]:
+        pattern_key = get_pattern_key(seqmap_inst.get_window_ids(start_index), dimensions)
+        pattern_occurences = seqmap_inst.find_key_occurences(pattern_key)
+        enum_patterns_inst.enumerate_pattern(pattern_key, pattern_occurences)
+        pattern_keys.append(pattern_key)
+    test_pattern_key, test_pattern_key_2 = pattern_keys[0], pattern_keys[2]
 
     def test_enumerate_pattern(self):
-        prep_metrics = [self.enum_patterns_inst._support[0],
-                        self.enum_patterns_inst._confidence[0],
-                        self.enum_patterns_inst._crossk[0]]
+        prep_metrics = [self.enum_patterns_inst.get_pattern_values('support')[0],
+                        self.enum_patterns_inst.get_pattern_values('confidence')[0],
+                        self.enum_patterns_inst.get_pattern_values('crossk')[0]]
         expected_metrics = [0.5555555555555556, 1.0, 2.5]
 
         self.assertListEqual(prep_metrics, expected_metrics)
 
     def test_pattern_exists(self):
         self.assertEqual(
-            self.enum_patterns_inst.find_pattern(self.test_pattern_str), 0)
+            self.enum_patterns_inst.find_pattern(self.test_pattern_key), 0)
 
     def test_get_pattern_indexes_topk(self):
         prep_pattern_indexes = self.enum_patterns_inst.get_pattern_indexes(
@@ -98,7 +74,103 @@ class TestEnumeratedPattern(unittest.TestCase):
     def test_get_patterns(self):
         prep_patterns = self.enum_patterns_inst.get_patterns([0, 2])
         self.assertListEqual(
-            prep_patterns, [self.test_pattern_str, self.test_pattern_str_2])
+            prep_patterns, [self.test_pattern_key, self.test_pattern_key_2])
+
+    def test_joinsets_with_long_lag(self):
+        # joinsets count anomalous windows in [index, index + lag], for any lag
+        rng = np.random.RandomState(5)
+        num_of_readings, lag = 500, 120
+        anomalous_windows = np.flatnonzero(rng.rand(num_of_readings) < 0.05).tolist()
+        enum_patterns_inst = EnumeratedPattern(anomalous_windows, num_of_readings, lag)
+
+        pattern_indexes = np.sort(rng.choice(num_of_readings - 1, 40, replace=False))
+        enum_patterns_inst.enumerate_pattern(
+            'pattern', OccurenceSet.from_indexes(num_of_readings - 1, pattern_indexes))
+
+        anomaly_counts = [len([x for x in anomalous_windows if i <= x <= i + lag])
+                          for i in pattern_indexes]
+        self.assertEqual(enum_patterns_inst.get_pattern_values('joinset_cardinality')[0],
+                         sum(anomaly_counts))
+        self.assertEqual(enum_patterns_inst.get_pattern_values('unique_joinset_cardinality')[0],
+                         len([x for x in anomaly_counts if x > 0]))
+
+    def test_enumerate_patterns_batch(self):
+        # a batch gives the same metrics as enumerating patterns one by one
+        rng = np.random.RandomState(7)
+        num_of_readings, lag = 300, 3
+        anomalous_windows = np.flatnonzero(rng.rand(num_of_readings) < 0.1).tolist()
+        patterns_occurences = [OccurenceSet.from_indexes(
+            num_of_readings - 1, np.sort(rng.choice(num_of_readings - 1, n, replace=False)))
+            for n in [1, 40, 7, 150]]
+
+        single_inst = EnumeratedPattern(anomalous_windows, num_of_readings, lag)
+        for i, pattern_occurences in enumerate(patterns_occurences):
+            single_inst.enumerate_pattern(i, pattern_occurences)
+
+        batch_inst = EnumeratedPattern(anomalous_windows, num_of_readings, lag)
+        batch_inst.enumerate_patterns([0, 1, 1, 2, 3], [patterns_occurences[0],
+                                                        patterns_occurences[1],
+                                                        patterns_occurences[1],
+                                                        patterns_occurences[2],
+                                                        patterns_occurences[3]])
+
+        self.assertEqual(batch_inst.num_of_patterns, 4)
+        self.assertTrue(single_inst.get_pattern_metrics(range(4)).equals(
+            batch_inst.get_pattern_metrics(range(4))))
+
+    def test_occurence_retention(self):
+        rng = np.random.RandomState(11)
+        num_of_readings, lag = 2000, 2
+        anomalous_windows = np.flatnonzero(rng.rand(num_of_readings) < 0.1).tolist()
+        patterns_indexes = [np.sort(rng.choice(num_of_readings - 1, n, replace=False))
+                            for n in [5, 300, 40, 900, 12]]
+        patterns_occurences = [OccurenceSet.from_indexes(num_of_readings - 1, x)
+                               for x in patterns_indexes]
+
+        first_inst = EnumeratedPattern(anomalous_windows, num_of_readings, lag)
+        compressed_inst = EnumeratedPattern(anomalous_windows, num_of_readings, lag,
+                                            'compressed')
+        ranked_inst = EnumeratedPattern(anomalous_windows, num_of_readings, lag, 'ranked')
+        ranked_inst.set_retention_rank('crossk', 'topk', k=2)
+
+        for inst in [first_inst, compressed_inst, ranked_inst]:
+            inst.enumerate_patterns(list(range(5)), patterns_occurences)
+            self.assertListEqual(
+                inst.get_pattern_metrics(range(5))['First Occurrence Index'].tolist(),
+                [x[0] for x in patterns_indexes])
+
+        self.assertIsNone(first_inst.get_pattern_occurences(0))
+        for i, indexes in enumerate(patterns_indexes):
+            self.assertListEqual(compressed_inst.get_pattern_occurences(i).tolist(),
+                                 indexes.tolist())
+
+        # ranked once flagged, patterns below threshold never take a top-k place
+        crossk_order = np.argsort(-ranked_inst.get_pattern_values('crossk'), kind='stable')
+        support_threshold = ranked_inst.get_pattern_values('support')[crossk_order[0]] + 1e-9
+        ranked_inst.are_above_threshold(crossk_order[:1].tolist(), 'support', 0)
+        ranked_inst.is_above_threshold(int(crossk_order[0]), 'support', support_threshold)
+        ranked_inst.are_above_threshold(crossk_order[1:].tolist(), 'support', 0)
+
+        topk_indexes = ranked_inst.get_pattern_indexes('crossk', 'topk', k=2)
+        retained_indexes = [i for i in range(5)
+                            if ranked_inst.get_pattern_occurences(i) is not None]
+        self.assertNotIn(crossk_order[0], topk_indexes)
+        self.assertListEqual(sorted(topk_indexes), retained_indexes)
+        for i in topk_indexes:
+            self.assertListEqual(ranked_inst.get_pattern_occurences(i).tolist(),
+                                 patterns_indexes[i].tolist())
+
+    def test_get_pattern_indexes_topk_ties(self):
+        # partial selection ranks as a full stable sort: value descending, index ascending
+        rng = np.random.RandomState(13)
+        values = rng.randint(0, 5, 400).astype(float)
+        values[rng.choice(400, 20, replace=False)] = np.nan
+        indexes = np.flatnonzero(rng.rand(400) < 0.8)
+
+        for k in [0, 1, 7, 60, 250, len(indexes), 1000]:
+            expected_indexes = indexes[np.argsort(-values[indexes], kind='stable')[:k]]
+            self.assertListEqual(_get_topk_indexes(values[indexes], indexes, k).tolist(),
+                                 expected_indexes.tolist())
 
     def test_is_above_threshold(self):
         self.assertTrue(
@@ -37,8 +37,9 @@ class TestLatticeGraph(unittest.TestCase):
         self.assertEqual(self.lattice_graph_inst.__str__(), expected_graph)
 
     def test_prune_parents(self):
-        self.clone_lattice_graph_inst.prune_nodes_recursively(
+        num_of_pruned_nodes = self.clone_lattice_graph_inst.prune_nodes_recursively(
             2, (0,), 'parents')
+        self.assertEqual(num_of_pruned_nodes, 4)
 
         expected_graph = ("{0: {}, 1: {'(1, 2)': {'parents': ['(0, 1, 2)'], "
                           "'children': ['(1,)', '(2,)']}}, 2: {'(1,)': "
@@ -0,0 +1,35 @@
+import unittest
+from module.mining import LazyLattice, BitmaskLattice
+
+
+class TestLazyLattice(unittest.TestCase):
+    num_of_dims = 4
+
+    def test_levels_without_pruning(self):
+        lazy_lattice_inst = LazyLattice(self.num_of_dims)
+        lattice_inst = BitmaskLattice(self.num_of_dims)
+
+        # bottom-up (joins) and top-down (combinations) both give the full levels
+        for depth in [3, 0, 2, 1]:
+            self.assertListEqual(lazy_lattice_inst.get_level(depth),
+                                 lattice_inst.get_level(depth))
+
+    def test_levels_with_pruning(self):
+        lazy_lattice_inst = LazyLattice(self.num_of_dims)
+
+        # singleton (2,) fails, then pair (0, 1) fails
+        lazy_lattice_inst.get_level(3)
+        self.assertEqual(lazy_lattice_inst.prune_nodes(0b0100, 'parents'), 1)
+        self.assertListEqual(lazy_lattice_inst.get_level(2),
+                             [0b0011, 0b1001, 0b1010])
+
+        lazy_lattice_inst.prune_nodes(0b0011, 'parents')
+        self.assertListEqual(lazy_lattice_inst.get_level(1), [])
+        self.assertTrue(lazy_lattice_inst.is_node_pruned(0b0011))
+
+        lazy_lattice_inst.reset()
+        self.assertListEqual(lazy_lattice_inst.get_level(0), [0b1111])
+
+
+if __name__ == '__main__':
+    unittest.main()
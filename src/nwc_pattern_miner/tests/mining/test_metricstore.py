@@ -0,0 +1,25 @@
+import unittest
+import numpy as np
+from module.mining.metricstore import MetricStore, initial_capacity
+
+
+class TestMetricStore(unittest.TestCase):
+
+    def test_append_rows(self):
+        metric_store = MetricStore({'count': np.int64, 'support': np.float64})
+        num_of_rows = initial_capacity * 2 + 3
+
+        # appending across capacity boundaries, keeps earlier rows
+        for start in range(0, num_of_rows, 500):
+            values = np.arange(start, min(start + 500, num_of_rows))
+            metric_store.append_rows({'count': values, 'support': values / 2})
+
+        self.assertEqual(len(metric_store), num_of_rows)
+        self.assertListEqual(metric_store.get_column('count').tolist(),
+                             list(range(num_of_rows)))
+        self.assertEqual(metric_store.get_column('support')[-1], (num_of_rows - 1) / 2)
+        self.assertEqual(metric_store.get_column('count').dtype, np.int64)
+
+
+if __name__ == '__main__':
+    unittest.main()
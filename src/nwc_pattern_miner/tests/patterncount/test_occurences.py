@@ -0,0 +1,73 @@
+import unittest
+import numpy as np
+import pandas as pd
+from module.utilities import get_pattern_key, mask_to_dimensions
+from module.patterncount import SequenceMap, VerticalOccurences, OccurenceSet
+from module.patterncount.occurences import intersect_occurences
+
+class TestOccurences(unittest.TestCase):
+
+    engrpm = np.array([2015, 1755, 1076, 2015, 1755, 1076, 2014, 1755, 1076])
+    brkpw = np.array([660, 574, 158, 610, 574, 158, 660, 574, 158])
+    nox = np.array([82, 48, 27, 13, 48, 26, 13, 48, 26])
+    ncwindow = np.array([0, 1, 1, 1, 0, 1, 0, 1, 1])
+    engine_data = pd.DataFrame(
+        {'engrpm': engrpm, 'brkpw': brkpw, 'nox': nox, 'ncwindow': ncwindow})
+
+    # Instantiating common instance
+    pattern_length = 2
+    seqmap_inst = SequenceMap(engine_data, 'ncwindow')
+    seqmap_inst.init_seq_map(pattern_length)
+    vertical_occurences_inst = VerticalOccurences(seqmap_inst)
+
+    def test_intersect_occurences(self):
+        found_occurences = intersect_occurences(np.array([0, 3, 4, 7, 9]),
+                                                np.array([1, 3, 5, 9]))
+        self.assertListEqual(found_occurences.tolist(), [3, 9])
+        self.assertListEqual(intersect_occurences(np.array([1, 2]),
+                                                  np.array([3, 4])).tolist(), [])
+
+    def test_occurence_set(self):
+        # dense occurences are packed as bits, intersections across representations agree
+        rng = np.random.RandomState(3)
+        num_of_windows = 1000
+        dense_indexes = np.flatnonzero(rng.rand(num_of_windows) < 0.5)
+        other_dense_indexes = np.flatnonzero(rng.rand(num_of_windows) < 0.4)
+        sparse_indexes = np.sort(rng.choice(num_of_windows, 10, replace=False))
+
+        dense_set = OccurenceSet.from_indexes(num_of_windows, dense_indexes)
+        other_dense_set = OccurenceSet.from_indexes(num_of_windows, other_dense_indexes)
+        sparse_set = OccurenceSet.from_indexes(num_of_windows, sparse_indexes)
+        self.assertTrue(dense_set.is_bitset())
+        self.assertFalse(sparse_set.is_bitset())
+        self.assertEqual(len(dense_set), len(dense_indexes))
+        self.assertEqual(dense_set.get_first_index(), dense_indexes[0])
+
+        for set_a, set_b, indexes_a, indexes_b in [
+                (dense_set, other_dense_set, dense_indexes, other_dense_indexes),
+                (dense_set, sparse_set, dense_indexes, sparse_indexes),
+                (sparse_set, dense_set, sparse_indexes, dense_indexes)]:
+            found_occurences = set_a.intersect(set_b)
+            self.assertListEqual(found_occurences.get_indexes().tolist(),
+                                 np.intersect1d(indexes_a, indexes_b).tolist())
+            self.assertEqual(len(found_occurences), len(np.intersect1d(indexes_a, indexes_b)))
+
+    def test_get_occurences(self):
+        # bottom-up order, with some nodes never asked for (already enumerated)
+        for start_index in range(self.engine_data.shape[0] - self.pattern_length + 1):
+            window_ids = self.seqmap_inst.get_window_ids(start_index)
+            self.vertical_occurences_inst.reset(window_ids)
+
+            for node_mask in [0b010, 0b100, 0b011, 0b101, 0b110, 0b111]:
+                pattern_key = get_pattern_key(window_ids, mask_to_dimensions(node_mask))
+                self.assertListEqual(
+                    self.vertical_occurences_inst.get_occurences(
+                        node_mask).get_indexes().tolist(),
+                    self.seqmap_inst.find_key_occurences(pattern_key).get_indexes().tolist())
+
+            # only the level below the last derived node is kept
+            self.assertListEqual(sorted(self.vertical_occurences_inst._occurences), [2, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,9 @@
+import os
 import unittest
+import tempfile
 import numpy as np
 import pandas as pd
+from module.utilities import get_pattern_key, SegmentBoundaries
 from module.patterncount import SequenceMap
 
 class TestStateGraph(unittest.TestCase):
@@ -32,16 +35,147 @@ class TestStateGraph(unittest.TestCase):
                     (13, 48): [3],
                     (48, 26): [4]}}
 
-        self.assertDictEqual(expected_seq_map, self.seqmap_inst._seq_hashmap)
+        seq_map = {name: {seq_key: occurences.get_indexes().tolist()
+                          for seq_key, occurences in dim_map.items()}
+                   for name, dim_map in self.seqmap_inst.get_seq_hashmap().items()}
+
+        self.assertDictEqual(expected_seq_map, seq_map)
+
+    def test_init_seq_map_long_patterns(self):
+        # windows of every length map to the same offsets as a plain python scan
+        rng = np.random.RandomState(7)
+        random_data = pd.DataFrame({'a': rng.randint(0, 3, 200),
+                                    'b': rng.randint(0, 50, 200) * 1.5,
+                                    'ncwindow': rng.randint(0, 2, 200)})
+        for pattern_length in [1, 3, 12]:
+            seqmap_inst = SequenceMap(random_data, 'ncwindow')
+            seqmap_inst.init_seq_map(pattern_length)
+
+            for name in ['a', 'b']:
+                expected_dim_map = dict()
+                for idx in range(len(random_data) - pattern_length + 1):
+                    seq_key = tuple(random_data[name].iloc[idx: idx + pattern_length])
+                    expected_dim_map.setdefault(seq_key, list()).append(idx)
+
+                dim_map = {seq_key: occurences.get_indexes().tolist() for seq_key, occurences
+                           in seqmap_inst.get_seq_hashmap()[name].items()}
+                self.assertDictEqual(expected_dim_map, dim_map)
+
+    def test_init_seq_map_threads(self):
+        # columns indexed in a thread pool give the same index as a serial build
+        seqmap_inst = SequenceMap(self.engine_data, 'ncwindow')
+        seqmap_inst.init_seq_map(self.pattern_length, n_jobs=3)
+
+        for start_index in range(len(self.engine_data) - self.pattern_length + 1):
+            self.assertListEqual(seqmap_inst.get_window_ids(start_index),
+                                 self.seqmap_inst.get_window_ids(start_index))
+        self.assertEqual(seqmap_inst.get_seq_hashmap().keys(),
+                         self.seqmap_inst.get_seq_hashmap().keys())
+        for name, dim_map in self.seqmap_inst.get_seq_hashmap().items():
+            for seq_key, occurences in dim_map.items():
+                self.assertListEqual(
+                    seqmap_inst.get_seq_hashmap()[name][seq_key].get_indexes().tolist(),
+                    occurences.get_indexes().tolist())
+
+    def test_extend_seq_map(self):
+        # index extended from shorter windows is the same as one built at that length
+        rng = np.random.RandomState(9)
+        random_data = pd.DataFrame({'a': rng.randint(0, 3, 150),
+                                    'b': rng.randint(0, 4, 150) * 1.5,
+                                    'ncwindow': rng.randint(0, 2, 150)})
+        invalid_seq_indexes = np.zeros(len(random_data), dtype=bool)
+        invalid_seq_indexes[[40, 41, 97]] = True
+        segment_boundaries = SegmentBoundaries(invalid_seq_indexes, len(random_data))
+
+        extended_inst = SequenceMap(random_data, 'ncwindow', segment_boundaries)
+        extended_inst.init_seq_map(2)
+        for pattern_length in [3, 5]:
+            extended_inst.extend_seq_map(pattern_length)
+            seqmap_inst = SequenceMap(random_data, 'ncwindow', segment_boundaries)
+            seqmap_inst.init_seq_map(pattern_length)
+
+            for start_index in range(len(random_data) - pattern_length + 1):
+                self.assertListEqual(extended_inst.get_window_ids(start_index),
+                                     seqmap_inst.get_window_ids(start_index))
+            for dim in range(2):
+                self.assertListEqual(extended_inst.get_window_values(dim).tolist(),
+                                     seqmap_inst.get_window_values(dim).tolist())
+                for window_id in range(len(seqmap_inst.get_window_values(dim))):
+                    self.assertListEqual(
+                        extended_inst.get_window_occurences(dim, window_id).get_indexes().tolist(),
+                        seqmap_inst.get_window_occurences(dim, window_id).get_indexes().tolist())
+
+        with self.assertRaises(Exception):
+            extended_inst.extend_seq_map(4)
+
+        # column codes are only kept while the index is to be extended
+        self.assertListEqual(self.seqmap_inst._column_codes, [])
+        planned_inst = SequenceMap(random_data, 'ncwindow', segment_boundaries)
+        planned_inst.init_seq_map(2, n_jobs=2, max_pattern_length=5)
+        self.assertEqual(len(planned_inst._column_codes), 2)
+        planned_inst.extend_seq_map(3, n_jobs=2)
+        self.assertEqual(len(planned_inst._column_codes), 2)
+        planned_inst.extend_seq_map(5, n_jobs=2)
+        self.assertListEqual(planned_inst._column_codes, [])
+        for start_index in range(len(random_data) - 4):
+            self.assertListEqual(planned_inst.get_window_ids(start_index),
+                                 extended_inst.get_window_ids(start_index))
+
+    def test_index_cache(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            self.seqmap_inst.init_seq_map(self.pattern_length, cache_dir=cache_dir)
+            index_path = os.path.join(
+                cache_dir, 'seqmap_' + self.seqmap_inst.get_fingerprint())
+            self.assertListEqual(os.listdir(cache_dir), [os.path.basename(index_path)])
+
+            # same data loads the memory mapped index
+            seqmap_inst = SequenceMap(self.engine_data.copy(), 'ncwindow')
+            seqmap_inst.init_seq_map(self.pattern_length)
+            self.assertTrue(seqmap_inst.load_index(index_path))
+            self.assertIsInstance(seqmap_inst._window_ids[0], np.memmap)
+            for start_index in range(len(self.engine_data) - self.pattern_length + 1):
+                self.assertListEqual(seqmap_inst.get_window_ids(start_index),
+                                     self.seqmap_inst.get_window_ids(start_index))
+            self.assertListEqual(
+                seqmap_inst.find_key_occurences((3, (1, 1))).get_indexes().tolist(), [1, 4])
+
+            # changed data (or pattern length) makes the cache stale, built in its own
+            # directory on init, leaving the cache of the other data as it is
+            changed_data = self.engine_data.copy()
+            changed_data.loc[3, 'nox'] = 48
+            seqmap_inst = SequenceMap(changed_data, 'ncwindow')
+            seqmap_inst.init_seq_map(self.pattern_length)
+            self.assertFalse(seqmap_inst.load_index(index_path))
+
+            seqmap_inst.init_seq_map(self.pattern_length, cache_dir=cache_dir)
+            self.assertNotIsInstance(seqmap_inst._window_ids[0], np.memmap)
+            changed_index_path = os.path.join(
+                cache_dir, 'seqmap_' + seqmap_inst.get_fingerprint())
+            self.assertTrue(seqmap_inst.load_index(changed_index_path))
+            self.assertEqual(len(os.listdir(cache_dir)), 2)
+
+            seqmap_inst = SequenceMap(self.engine_data.copy(), 'ncwindow')
+            seqmap_inst.init_seq_map(self.pattern_length, cache_dir=cache_dir)
+            self.assertIsInstance(seqmap_inst._window_ids[0], np.memmap)
 
     def test_find_pattern_occurences(self):
         dimensions = ['engrpm', 'brkpw', 'nox']
         found_occurences = self.seqmap_inst.find_pattern_occurences(
-            self.engine_data[dimensions].iloc[1:3])
+            self.engine_data[dimensions].iloc[1:3]).get_indexes().tolist()
         expected_occurences = [1]
 
         self.assertListEqual(expected_occurences, found_occurences)
 
+    def test_pattern_key(self):
+        pattern_key = get_pattern_key(self.seqmap_inst.get_window_ids(1), (0, 1))
+
+        self.assertEqual(pattern_key, (3, (1, 1)))
+        self.assertListEqual(
+            self.seqmap_inst.find_key_occurences(pattern_key).get_indexes().tolist(), [1, 4])
+        self.assertDictEqual(self.seqmap_inst.get_pattern_df(pattern_key).to_dict(),
+                             self.engine_data[['engrpm', 'brkpw']].iloc[1:3].reset_index(
+                                 drop=True).to_dict())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -49,6 +49,27 @@ class TestSupportPruning(unittest.TestCase):
 
         self.assertListEqual(output_pruning, expected_pruning)
 
+    def test_lazy_lattice(self):
+        # lazily generated lattice enumerates the same patterns, in the same order
+        enum_patterns_inst = EnumeratedPattern(
+            self.anomalous_windows, self.num_of_readings, self.lag)
+        lazy_enum_patterns_inst = EnumeratedPattern(
+            self.anomalous_windows, self.num_of_readings, self.lag)
+        pruning_inst = SupportPruning(
+            self.num_of_dims, self.engine_data, enum_patterns_inst,
+            self.seqmap_inst, self.threshold_value)
+        lazy_pruning_inst = SupportPruning(
+            self.num_of_dims, self.engine_data, lazy_enum_patterns_inst,
+            self.seqmap_inst, self.threshold_value, lazy_lattice=True)
+
+        for start_index in range(self.num_of_readings - self.pattern_length + 1):
+            end_index = start_index + self.pattern_length
+            pruning_inst.prune_and_enumerate_patterns(start_index, end_index)
+            lazy_pruning_inst.prune_and_enumerate_patterns(start_index, end_index)
+
+        self.assertListEqual(list(enum_patterns_inst._patterns.keys()),
+                             list(lazy_enum_patterns_inst._patterns.keys()))
+
 
 if __name__ == '__main__':
     unittest.main()
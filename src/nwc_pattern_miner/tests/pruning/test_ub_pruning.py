@@ -52,6 +52,17 @@ class TestUBPruning(unittest.TestCase):
 
         self.assertListEqual(output_pruning, expected_pruning)
 
+    def test_wide_data(self):
+        # top-down walk over all subsets, refused where the lattice is generated lazily
+        wide_data = pd.DataFrame({'f{0}'.format(i): self.engrpm for i in range(21)})
+        wide_data['ncwindow'] = self.ncwindow
+        seqmap_inst = SequenceMap(wide_data, 'ncwindow')
+        seqmap_inst.init_seq_map(self.pattern_length)
+
+        with self.assertRaises(Exception):
+            UBPruning(21, wide_data, self.enum_patterns_inst, seqmap_inst,
+                      self.threshold_support_value, self.threshold_crossk_value)
+
 
 if __name__ == '__main__':
     unittest.main()
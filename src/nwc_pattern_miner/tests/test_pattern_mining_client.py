@@ -1,10 +1,14 @@
+import os
 import unittest
+import tempfile
 import numpy as np
 import pandas as pd
-from module.utilities import stringify_dataframe
+from module.utilities import get_pattern_key
 from module.patterncount import SequenceMap
 from module.mining import EnumeratedPattern
-from module.pattern_mining_client import format_output
+from module.pattern_mining_client import format_output, mine_multi_series_patterns
+from module.pattern_mining_client import mine_sequence_patterns, MiningSession
+from module.pattern_mining_client import mine_threshold_sweep
 
 class TestPatternClient(unittest.TestCase):
 
@@ -20,10 +24,6 @@ class TestPatternClient(unittest.TestCase):
     seqmap_inst = SequenceMap(engine_data, 'ncwindow')
     seqmap_inst.init_seq_map(pattern_length)
 
-    # Enumerating a pattern
-    dimensions = ['engrpm', 'brkpw']
-    pattern_df = engine_data[dimensions].iloc[1:3]
-
     # Instantiating Enumeration of patterns
     lag = 1
     num_of_readings = 9
@@ -31,40 +31,17 @@ class TestPatternClient(unittest.TestCase):
     enum_patterns_inst = EnumeratedPattern(
         anomalous_windows, num_of_readings, lag)
 
-    # Enumerating patterns
-    test_pattern_str = stringify_dataframe(pattern_df)
-    pattern_occurences = seqmap_inst.find_pattern_occurences(pattern_df)
-    enum_patterns_inst.enumerate_pattern(
-        test_pattern_str, pattern_occurences)
-
-    dimensions = ['engrpm', 'brkpw', 'nox']
-    pattern_df = engine_data[dimensions].iloc[1:3]
-    pattern_str = stringify_dataframe(pattern_df)
-    pattern_occurences = seqmap_inst.find_pattern_occurences(pattern_df)
-    enum_patterns_inst.enumerate_pattern(pattern_str, pattern_occurences)
-
-    dimensions = ['nox']
-    pattern_df = engine_data[dimensions].iloc[4:6]
-    test_pattern_str_2 = stringify_dataframe(pattern_df)
-    pattern_occurences = seqmap_inst.find_pattern_occurences(pattern_df)
-    enum_patterns_inst.enumerate_pattern(
-        test_pattern_str_2, pattern_occurences)
-
-    dimensions = ['brkpw']
-    pattern_df = engine_data[dimensions].iloc[2:4]
-    pattern_str = stringify_dataframe(pattern_df)
-    pattern_occurences = seqmap_inst.find_pattern_occurences(pattern_df)
-    enum_patterns_inst.enumerate_pattern(pattern_str, pattern_occurences)
-
-    dimensions = ['nox', 'brkpw']
-    pattern_df = engine_data[dimensions].iloc[7:9]
-    pattern_str = stringify_dataframe(pattern_df)
-    pattern_occurences = seqmap_inst.find_pattern_occurences(pattern_df)
-    enum_patterns_inst.enumerate_pattern(pattern_str, pattern_occurences)
+    # Enumerating patterns (start index, dimensions)
+    for start_index, dimensions in [(1, (0, 1)), (1, (0, 1, 2)), (4, (2,)),
+                                    (2, (1,)), (7, (1, 2))]:
+        pattern_key = get_pattern_key(
+            seqmap_inst.get_window_ids(start_index), dimensions)
+        pattern_occurences = seqmap_inst.find_key_occurences(pattern_key)
+        enum_patterns_inst.enumerate_pattern(pattern_key, pattern_occurences)
 
     def test_format_output_threshold(self):
         output_df = format_output(['engrpm', 'brkpw', 'nox'], self.enum_patterns_inst,
-                                  self.pattern_length, metric='crossk',
+                                  self.seqmap_inst, self.pattern_length, metric='crossk',
                                   filter_type='threshold', threshold=2.5)
 
         expected_df = pd.DataFrame({'engrpm': ['1755 1076', '1755 1076', ' '],
@@ -82,7 +59,7 @@ class TestPatternClient(unittest.TestCase):
 
     def test_format_output_topk(self):
         output_df = format_output(['engrpm', 'brkpw', 'nox'], self.enum_patterns_inst,
-                                  self.pattern_length, metric='support',
+                                  self.seqmap_inst, self.pattern_length, metric='support',
                                   filter_type='topk', k=2)
 
         expected_df = pd.DataFrame({'engrpm': ['1755 1076', ' '],
@@ -97,6 +74,293 @@ class TestPatternClient(unittest.TestCase):
 
         self.assertDictEqual(output_df.to_dict(), expected_df.to_dict())
 
+    def test_format_output_values(self):
+        # whole valued float windows are written as integers, other values as they are
+        mixed_data = pd.DataFrame({'speed': [2.0, 3.0, 3.5, 2.0, 3.0],
+                                   'gear': ['d', 'n', 'd', 'd', 'n'],
+                                   'brake': [True, False, False, True, False],
+                                   'ncwindow': [1, 0, 1, 1, 0]})
+        seqmap_inst = SequenceMap(mixed_data, 'ncwindow')
+        seqmap_inst.init_seq_map(self.pattern_length)
+        enum_patterns_inst = EnumeratedPattern([0, 2, 3], 5, 0)
+        for start_index, dimensions in [(0, (0, 1)), (1, (0, 2)), (2, (1,))]:
+            pattern_key = get_pattern_key(seqmap_inst.get_window_ids(start_index), dimensions)
+            enum_patterns_inst.enumerate_pattern(
+                pattern_key, seqmap_inst.find_key_occurences(pattern_key))
+
+        output_df = format_output(['speed', 'gear', 'brake'], enum_patterns_inst, seqmap_inst,
+                                  self.pattern_length, metric='support',
+                                  filter_type='threshold', threshold=0)
+        self.assertListEqual(output_df['speed'].tolist(), ['2 3', '3.0 3.5', ' '])
+        self.assertListEqual(output_df['gear'].tolist(), ['d n', ' ', 'd d'])
+        self.assertListEqual(output_df['brake'].tolist(), [' ', 'False False', ' '])
+
+        codes_df = format_output(['speed', 'gear', 'brake'], enum_patterns_inst, seqmap_inst,
+                                 self.pattern_length, metric='support',
+                                 filter_type='threshold', threshold=0, output_codes=True)
+        self.assertListEqual(codes_df['gear'].tolist(), [1, -1, 0])
+        self.assertListEqual(seqmap_inst.get_window_values(1)[1].tolist(), ['d', 'n'])
+        self.assertTrue(codes_df.iloc[:, 3:].equals(output_df.iloc[:, 3:]))
+
+    def test_mine_multi_series_patterns(self):
+        rng = np.random.RandomState(3)
+        trips = [pd.DataFrame({'a': rng.randint(0, 2, n), 'b': rng.randint(0, 3, n),
+                               'ncwindow': (rng.rand(n) < 0.3).astype(int)})
+                 for n in [15, 1, 9, 20]]
+        mining_params = dict(nc_window_col='ncwindow', support_threshold=0.01,
+                             crossk_threshold=1.0, pattern_length=3, lag=2,
+                             output_type='threshold', output_metric='support',
+                             output_threshold=0.001)
+
+        output_df = mine_multi_series_patterns(trips, **mining_params)
+
+        # series given by a group column, with rows of the trips interleaved
+        grouped_df = pd.concat([x.assign(trip=i) for i, x in enumerate(trips)],
+                               ignore_index=True)
+        interleaved_df = grouped_df.iloc[np.argsort(
+            grouped_df.groupby('trip').cumcount().to_numpy(), kind='stable')]
+        self.assertTrue(output_df.equals(mine_multi_series_patterns(
+            interleaved_df, group_col='trip', **mining_params)))
+
+        # counts are windows within a single trip, joinsets look ahead within the trip
+        for _, row in output_df.iterrows():
+            count, joinset_count = 0, 0
+            for trip in trips:
+                for start in range(len(trip) - 2):
+                    window = trip.iloc[start: start + 3]
+                    if all(' '.join(window[x].astype(str)) == row[x]
+                           for x in ['a', 'b'] if row[x].strip()):
+                        count += 1
+                        joinset_count += trip['ncwindow'].iloc[start: start + 3].sum()
+
+            self.assertEqual(row['Count'], count)
+            self.assertAlmostEqual(row['Support'], joinset_count / len(grouped_df))
+
+    def test_mining_session(self):
+        rng = np.random.RandomState(8)
+        series_df = pd.DataFrame({'a': rng.randint(0, 2, 60), 'b': rng.randint(0, 3, 60),
+                                  'ncwindow': (rng.rand(60) < 0.2).astype(int)})
+        mining_params = dict(series_df=series_df, nc_window_col='ncwindow',
+                             support_threshold=0.01, crossk_threshold=1.0, pattern_length=2,
+                             lag=1, occurence_retention='compressed')
+        queries = [dict(output_metric='support', output_type='threshold',
+                        output_threshold=0.05),
+                   dict(output_metric='crossk', output_type='topk', topk=5)]
+
+        output_df, session = mine_sequence_patterns(return_session=True, **mining_params)
+        self.assertTrue(output_df.equals(session.query()))
+
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            snapshot_path = os.path.join(snapshot_dir, 'session.npz')
+            session.save(snapshot_path)
+            loaded_session = MiningSession.load(snapshot_path)
+
+        # queries answered as if mined again, also from a saved snapshot
+        for query in queries:
+            expected_df = mine_sequence_patterns(**mining_params, **query)
+            self.assertTrue(expected_df.equals(session.query(**query)))
+            self.assertTrue(expected_df.equals(loaded_session.query(**query)))
+
+        self.assertIsNotNone(session.get_mining_stats())
+        self.assertDictEqual(loaded_session.get_mining_stats(), session.get_mining_stats())
+
+        enum_patterns_inst = session.get_enum_pattern_inst()
+        loaded_patterns_inst = loaded_session.get_enum_pattern_inst()
+        self.assertEqual(loaded_patterns_inst.num_of_patterns, enum_patterns_inst.num_of_patterns)
+        self.assertListEqual(loaded_patterns_inst.get_pattern_occurences(3).tolist(),
+                             enum_patterns_inst.get_pattern_occurences(3).tolist())
+
+    def test_mine_wide_patterns(self):
+        # pattern keys of dimensions above 63 (masks beyond int64) in the output
+        rng = np.random.RandomState(16)
+        series_df = pd.DataFrame({'f{0}'.format(i): rng.randint(0, 40, 80) for i in range(70)})
+        series_df['f3'] = rng.randint(0, 2, 80)
+        series_df['f66'] = rng.randint(0, 2, 80)
+        series_df['f68'] = series_df['f66']
+        series_df['ncwindow'] = (rng.rand(80) < 0.3).astype(int)
+
+        output_df, session = mine_sequence_patterns(
+            series_df, 'ncwindow', 0.05, 1.0, 1, lag=1, output_metric='support',
+            output_type='threshold', output_threshold=0.05, return_session=True)
+
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            snapshot_path = os.path.join(snapshot_dir, 'session.npz')
+            session.save(snapshot_path)
+            loaded_session = MiningSession.load(snapshot_path)
+        self.assertTrue(output_df.equals(loaded_session.query(
+            'support', 'threshold', output_threshold=0.05)))
+
+        feature_cols = output_df.columns[:70]
+        self.assertTrue((output_df[['f66', 'f68']].apply(
+            lambda x: x.str.strip()) != '').all(axis=1).any())
+        for _, row in output_df.iterrows():
+            pattern = {x: int(row[x]) for x in feature_cols if row[x].strip()}
+            self.assertEqual(row['Count'], int((series_df[list(pattern)] == pd.Series(
+                pattern)).all(axis=1).sum()))
+
+    def test_mine_pattern_lengths(self):
+        rng = np.random.RandomState(6)
+        series_df = pd.DataFrame({'a': rng.randint(0, 2, 120), 'b': rng.randint(0, 3, 120),
+                                  'ncwindow': (rng.rand(120) < 0.2).astype(int)})
+        mining_params = dict(lag=1, invalid_seq_indexes=[50], count_within_segments=True,
+                             output_metric='support', output_type='threshold',
+                             output_threshold=0.01)
+
+        output_df, sessions = mine_sequence_patterns(
+            series_df, 'ncwindow', 0.01, 1.0, range(3, 1, -1), return_session=True,
+            **mining_params)
+
+        # one index extended across lengths, same patterns as mining every length alone
+        self.assertListEqual(sorted(sessions.keys()), [2, 3])
+        for pattern_length in [2, 3]:
+            expected_df = mine_sequence_patterns(series_df, 'ncwindow', 0.01, 1.0,
+                                                 pattern_length, **mining_params)
+            self.assertTrue(expected_df.equals(output_df.loc[pattern_length]))
+            self.assertTrue(expected_df.equals(sessions[pattern_length].query(
+                'support', 'threshold', output_threshold=0.01)))
+
+        # lengths without patterns are kept in the pattern length level
+        output_df = mine_sequence_patterns(series_df, 'ncwindow', 0.01, 1.0, [2, 80],
+                                           **mining_params)
+        self.assertListEqual(output_df.index.levels[0].tolist(), [2, 80])
+        self.assertListEqual(output_df.index.get_level_values(0).unique().tolist(), [2])
+
+    def test_mine_multi_target_patterns(self):
+        rng = np.random.RandomState(12)
+        series_df = pd.DataFrame({'nox': (rng.rand(100) < 0.2).astype(int),
+                                  'a': rng.randint(0, 2, 100), 'b': rng.randint(0, 3, 100),
+                                  'pm': (rng.rand(100) < 0.1).astype(int),
+                                  'c': rng.randint(0, 2, 100)})
+        query = dict(output_metric='crossk', output_type='topk', topk=20)
+
+        output_dfs, sessions = mine_sequence_patterns(
+            series_df, ['nox', 'pm'], 0.01, 1.0, [2, 3], lag=1, return_session=True, **query)
+
+        # same patterns as mining every target alone, on the feature columns only
+        self.assertListEqual(list(output_dfs.keys()), ['nox', 'pm'])
+        for target_col, other_col in [('nox', 'pm'), ('pm', 'nox')]:
+            expected_df = mine_sequence_patterns(series_df.drop(columns=other_col),
+                                                 target_col, 0.01, 1.0, [2, 3], lag=1,
+                                                 **query)
+            self.assertListEqual(output_dfs[target_col].columns[:3].tolist(), ['a', 'b', 'c'])
+            self.assertTrue(expected_df.equals(output_dfs[target_col]))
+            self.assertTrue(expected_df.loc[3].equals(sessions[target_col][3].query(**query)))
+
+    def test_mine_dynamic_crossk(self):
+        # rare readings co-occur with anomalies, frequent ones bound crossk below the top-k
+        rng = np.random.RandomState(2)
+        series_df = pd.DataFrame({'a': np.zeros(400, dtype=int), 'b': np.zeros(400, dtype=int),
+                                  'c': np.zeros(400, dtype=int), 'd': rng.randint(0, 2, 400),
+                                  'ncwindow': np.zeros(400, dtype=int)})
+        series_df.loc[[20, 90, 150, 230, 310], ['a', 'b', 'c', 'ncwindow']] = 1
+        series_df.loc[rng.choice(400, 8, replace=False), 'ncwindow'] = 1
+        mining_params = dict(pruning_type='bi-dr', output_metric='crossk', output_type='topk',
+                             topk=3, return_session=True)
+
+        output_df, session = mine_sequence_patterns(series_df, 'ncwindow', 0.0, 0.5, 1,
+                                                    **mining_params)
+        dynamic_df, dynamic_session = mine_sequence_patterns(
+            series_df, 'ncwindow', 0.0, 0.5, 1, dynamic_crossk=True, **mining_params)
+
+        self.assertTrue(output_df.equals(dynamic_df))
+        self.assertLess(dynamic_session.get_enum_pattern_inst().num_of_patterns,
+                        session.get_enum_pattern_inst().num_of_patterns)
+
+    def test_mine_resume(self):
+        rng = np.random.RandomState(15)
+        series_df = pd.DataFrame({'a': rng.randint(0, 2, 120), 'b': rng.randint(0, 3, 120),
+                                  'ncwindow': (rng.rand(120) < 0.2).astype(int)})
+        mining_params = dict(lag=1, pruning_type='bi-dr', output_metric='crossk',
+                             output_type='topk', topk=10)
+        expected_df = mine_sequence_patterns(series_df, 'ncwindow', 0.01, 1.0, [2, 3],
+                                             **mining_params)
+
+        with tempfile.TemporaryDirectory() as checkpoint_dir:
+            partial_df = mine_sequence_patterns(series_df, 'ncwindow', 0.01, 1.0, [2, 3],
+                                                max_enumerations=5,
+                                                checkpoint_dir=checkpoint_dir,
+                                                **mining_params)
+
+            # stopped early, both pattern lengths resume from their checkpoint
+            self.assertListEqual(sorted(os.listdir(checkpoint_dir)),
+                                 ['checkpoint_ncwindow_2.npz', 'checkpoint_ncwindow_3.npz'])
+
+            resumed_df = mine_sequence_patterns(series_df, 'ncwindow', 0.01, 1.0, [2, 3],
+                                                checkpoint_dir=checkpoint_dir, resume=True,
+                                                **mining_params)
+            self.assertFalse(expected_df.equals(partial_df))
+            self.assertTrue(expected_df.equals(resumed_df))
+
+            # checkpoints only resume the same data and mining configuration
+            changed_data = series_df.copy()
+            changed_data.loc[7, 'a'] = 1 - changed_data.loc[7, 'a']
+            changed_target = series_df.copy()
+            changed_target.loc[7, 'ncwindow'] = 1 - changed_target.loc[7, 'ncwindow']
+            for setting, data, thresholds, changed_params in [
+                    ('support_threshold', series_df, (0.02, 1.0), dict()),
+                    ('crossk_threshold', series_df, (0.01, 1.5), dict()),
+                    ('pruning_type', series_df, (0.01, 1.0), dict(pruning_type='apriori')),
+                    ('lag', series_df, (0.01, 1.0), dict(lag=2)),
+                    ('retention_rank', series_df, (0.01, 1.0), dict(topk=5)),
+                    ('topk', series_df, (0.01, 1.0), dict(dynamic_crossk=True)),
+                    ('data', changed_data, (0.01, 1.0), dict()),
+                    ('target', changed_target, (0.01, 1.0), dict())]:
+                with self.assertRaisesRegex(
+                        Exception, 'different mining configuration: .*\\b' + setting + '\\b'):
+                    mine_sequence_patterns(data, 'ncwindow', *thresholds, [2, 3],
+                                           checkpoint_dir=checkpoint_dir, resume=True,
+                                           **dict(mining_params, **changed_params))
+
+    def test_mine_resume_wide(self):
+        # checkpoints of patterns with dimensions above 63 (masks beyond int64)
+        rng = np.random.RandomState(17)
+        series_df = pd.DataFrame({'f{0}'.format(i): rng.randint(0, 40, 80) for i in range(70)})
+        series_df['f66'] = rng.randint(0, 2, 80)
+        series_df['f68'] = series_df['f66']
+        series_df['ncwindow'] = (rng.rand(80) < 0.3).astype(int)
+        mining_params = dict(lag=1, output_metric='support', output_type='threshold',
+                             output_threshold=0.05)
+        expected_df = mine_sequence_patterns(series_df, 'ncwindow', 0.05, 1.0, 1,
+                                             **mining_params)
+
+        with tempfile.TemporaryDirectory() as checkpoint_dir:
+            partial_df = mine_sequence_patterns(series_df, 'ncwindow', 0.05, 1.0, 1,
+                                                max_enumerations=100,
+                                                checkpoint_dir=checkpoint_dir,
+                                                **mining_params)
+            resumed_df = mine_sequence_patterns(series_df, 'ncwindow', 0.05, 1.0, 1,
+                                                checkpoint_dir=checkpoint_dir, resume=True,
+                                                **mining_params)
+
+        self.assertTrue(partial_df.attrs['mining_stats']['is_partial'])
+        self.assertTrue(expected_df.equals(resumed_df))
+
+    def test_mine_threshold_sweep(self):
+        rng = np.random.RandomState(4)
+        series_df = pd.DataFrame({'a': rng.randint(0, 2, 200), 'b': rng.randint(0, 3, 200),
+                                  'c': rng.randint(0, 2, 200),
+                                  'ncwindow': (rng.rand(200) < 0.2).astype(int)})
+        support_thresholds = [0.005, 0.02, 0.05]
+        output_params = dict(lag=1, invalid_seq_indexes=[20, 21], output_metric='support',
+                             output_type='threshold', output_threshold=0.01)
+
+        sweep_df = mine_threshold_sweep(series_df, 'ncwindow', support_thresholds, [-1, 2.0],
+                                        3, **output_params)
+
+        # same patterns as mining at every support threshold, crossk threshold as a filter
+        for support_threshold in support_thresholds:
+            expected_df = mine_sequence_patterns(series_df, 'ncwindow', support_threshold,
+                                                 1.0, 3, **output_params)
+            self.assertTrue(expected_df.equals(sweep_df.loc[(support_threshold, -1)]))
+            self.assertTrue(expected_df[expected_df['Kvalue'] >= 2.0].reset_index(
+                drop=True).equals(sweep_df.loc[(support_threshold, 2.0)]))
+
+        # one target column and pattern length
+        for target_col, pattern_length in [(['ncwindow'], 3), ('ncwindow', [2, 3])]:
+            with self.assertRaises(ValueError):
+                mine_threshold_sweep(series_df, target_col, support_thresholds, [-1, 2.0],
+                                     pattern_length, **output_params)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,8 +1,11 @@
+import os
 import unittest
+import tempfile
+import threading
 import numpy as np
 import pandas as pd
 
-from module.pruning import SupportPruning
+from module.pruning import SupportPruning, UBPruning
 from module.patterncount import SequenceMap
 from module.mining import EnumeratedPattern
 from module.patternminer import PatternMiner
@@ -42,13 +45,203 @@ class TestPatternClient(unittest.TestCase):
     def test_mine(self):
         self.patternminer_inst.mine()
 
-        output_pattern_count = self.enum_patterns_inst._patterncount
+        output_pattern_count = self.enum_patterns_inst.get_pattern_values(
+            'patterncount').tolist()
 
         expected_pattern_count = [2, 2, 1, 3,
                                   3, 1, 3, 1, 1, 1, 1, 2, 1, 1, 1, 2]
 
         self.assertListEqual(expected_pattern_count, output_pattern_count)
 
+    def test_mine_parallel(self):
+        # windows mined by worker processes, merged into the same patterns as serial
+        enum_patterns_inst = EnumeratedPattern(
+            self.anomalous_windows, self.num_of_readings, self.lag)
+        pruning_inst = SupportPruning(self.num_of_dims, self.engine_data, enum_patterns_inst,
+                                      self.seqmap_inst, self.threshold_value)
+        PatternMiner(self.pattern_length, self.num_of_dims, self.invalid_seq_indexes,
+                     enum_patterns_inst, pruning_inst, n_jobs=2).mine()
+
+        serial_patterns_inst = EnumeratedPattern(
+            self.anomalous_windows, self.num_of_readings, self.lag)
+        serial_pruning_inst = SupportPruning(self.num_of_dims, self.engine_data,
+                                             serial_patterns_inst, self.seqmap_inst,
+                                             self.threshold_value)
+        PatternMiner(self.pattern_length, self.num_of_dims, self.invalid_seq_indexes,
+                     serial_patterns_inst, serial_pruning_inst).mine()
+
+        num_of_patterns = serial_patterns_inst.num_of_patterns
+        self.assertEqual(enum_patterns_inst.num_of_patterns, num_of_patterns)
+        self.assertListEqual(enum_patterns_inst.get_patterns(range(num_of_patterns)),
+                             serial_patterns_inst.get_patterns(range(num_of_patterns)))
+        self.assertTrue(enum_patterns_inst.get_pattern_metrics(range(num_of_patterns)).equals(
+            serial_patterns_inst.get_pattern_metrics(range(num_of_patterns))))
+        self.assertEqual(pruning_inst.num_of_pruned_nodes,
+                         serial_pruning_inst.num_of_pruned_nodes)
+
+    def test_duplicate_windows(self):
+        # windows starting at 4 and 7 have the same data segment, the later one is skipped
+        enum_patterns_inst = EnumeratedPattern(
+            self.anomalous_windows, self.num_of_readings, self.lag)
+        pruning_inst = SupportPruning(self.num_of_dims, self.engine_data, enum_patterns_inst,
+                                      self.seqmap_inst, self.threshold_value)
+        patternminer_inst = PatternMiner(self.pattern_length, self.num_of_dims, [],
+                                         enum_patterns_inst, pruning_inst)
+        patternminer_inst.mine()
+
+        all_windows_inst = EnumeratedPattern(
+            self.anomalous_windows, self.num_of_readings, self.lag)
+        all_windows_pruning_inst = SupportPruning(self.num_of_dims, self.engine_data,
+                                                  all_windows_inst, self.seqmap_inst,
+                                                  self.threshold_value)
+        for start_index in range(self.num_of_readings - self.pattern_length + 1):
+            all_windows_pruning_inst.prune_and_enumerate_patterns(
+                start_index, start_index + self.pattern_length)
+
+        self.assertEqual(patternminer_inst.num_of_duplicate_windows, 1)
+        self.assertListEqual(
+            enum_patterns_inst.get_patterns(range(enum_patterns_inst.num_of_patterns)),
+            all_windows_inst.get_patterns(range(all_windows_inst.num_of_patterns)))
+
+    def test_mine_partial(self):
+        def mine_with(**mining_limits):
+            enum_patterns_inst = EnumeratedPattern(
+                self.anomalous_windows, self.num_of_readings, self.lag)
+            pruning_inst = SupportPruning(self.num_of_dims, self.engine_data,
+                                          enum_patterns_inst, self.seqmap_inst,
+                                          self.threshold_value)
+            patternminer_inst = PatternMiner(self.pattern_length, self.num_of_dims, [],
+                                             enum_patterns_inst, pruning_inst, **mining_limits)
+            patternminer_inst.mine()
+            return patternminer_inst.get_mining_stats(), enum_patterns_inst
+
+        complete_stats, complete_inst = mine_with()
+        self.assertFalse(complete_stats['is_partial'])
+        self.assertEqual(complete_stats['covered_anomalous_windows'],
+                         len(self.anomalous_windows))
+
+        # stops between windows, once the first window enumerated its patterns
+        partial_stats, partial_inst = mine_with(max_enumerations=1)
+        self.assertTrue(partial_stats['is_partial'])
+        self.assertEqual(partial_stats['stop_reason'], 'max_enumerations')
+        self.assertEqual(partial_stats['mined_windows'], 1)
+        self.assertEqual(partial_stats['covered_anomalous_windows'], 0)
+        self.assertListEqual(partial_inst.get_patterns(range(partial_inst.num_of_patterns)),
+                             complete_inst.get_patterns(range(partial_inst.num_of_patterns)))
+
+        cancel_token = threading.Event()
+        cancel_token.set()
+        cancelled_stats, cancelled_inst = mine_with(cancel_token=cancel_token)
+        self.assertEqual(cancelled_stats['stop_reason'], 'cancelled')
+        self.assertEqual(cancelled_inst.num_of_patterns, 0)
+        self.assertEqual(mine_with(time_budget=0)[0]['stop_reason'], 'time_budget')
+
+        # densest windows first, all windows mined finds the same patterns
+        density_stats, density_inst = mine_with(window_order='density')
+        self.assertDictEqual(density_stats, complete_stats)
+        self.assertSetEqual(set(density_inst.get_patterns(range(density_inst.num_of_patterns))),
+                            set(complete_inst.get_patterns(range(complete_inst.num_of_patterns))))
+
+    def test_ranked_occurence_retention(self):
+        # patterns below the support threshold never take the place of output patterns
+        for seed in range(6):
+            rng = np.random.RandomState(seed)
+            random_data = pd.DataFrame({'a': rng.randint(0, 2, 200),
+                                        'b': rng.randint(0, 3, 200),
+                                        'c': rng.randint(0, 2, 200),
+                                        'ncwindow': (rng.rand(200) < 0.2).astype(int)})
+            seqmap_inst = SequenceMap(random_data, 'ncwindow')
+            seqmap_inst.init_seq_map(self.pattern_length)
+            anomalous_windows = np.flatnonzero(random_data['ncwindow']).tolist()
+
+            for pruning_type, n_jobs in [('apriori', 1), ('apriori', 2), ('bi-dr', 1)]:
+                enum_patterns_inst = EnumeratedPattern(anomalous_windows, len(random_data),
+                                                       self.lag, 'ranked')
+                enum_patterns_inst.set_retention_rank('crossk', 'topk', k=5)
+                if pruning_type == 'apriori':
+                    pruning_inst = SupportPruning(3, random_data, enum_patterns_inst,
+                                                  seqmap_inst, 0.05)
+                else:
+                    pruning_inst = UBPruning(3, random_data, enum_patterns_inst, seqmap_inst,
+                                             0.05, 1.0)
+                PatternMiner(self.pattern_length, 3, anomalous_windows, enum_patterns_inst,
+                             pruning_inst, n_jobs=n_jobs).mine()
+
+                topk_indexes = enum_patterns_inst.get_pattern_indexes('crossk', 'topk', k=5)
+                retained_indexes = [
+                    i for i in range(enum_patterns_inst.num_of_patterns)
+                    if enum_patterns_inst.get_pattern_occurences(i) is not None]
+                self.assertListEqual(sorted(topk_indexes), retained_indexes)
+                for i in topk_indexes:
+                    self.assertListEqual(
+                        enum_patterns_inst.get_pattern_occurences(i).tolist(),
+                        seqmap_inst.find_key_occurences(
+                            enum_patterns_inst.get_patterns([i])[0]).get_indexes().tolist())
+
+    def test_resume(self):
+        rng = np.random.RandomState(14)
+        random_data = pd.DataFrame({'a': rng.randint(0, 2, 150), 'b': rng.randint(0, 3, 150),
+                                    'c': rng.randint(0, 2, 150),
+                                    'ncwindow': (rng.rand(150) < 0.2).astype(int)})
+        seqmap_inst = SequenceMap(random_data, 'ncwindow')
+        seqmap_inst.init_seq_map(self.pattern_length)
+        anomalous_windows = np.flatnonzero(random_data['ncwindow']).tolist()
+
+        def create_miner(pruning_type, **mining_params):
+            enum_patterns_inst = EnumeratedPattern(anomalous_windows, len(random_data),
+                                                   self.lag, 'ranked')
+            enum_patterns_inst.set_retention_rank('crossk', 'topk', k=5)
+            if pruning_type == 'apriori':
+                pruning_inst = SupportPruning(3, random_data, enum_patterns_inst, seqmap_inst,
+                                              0.01)
+            else:
+                pruning_inst = UBPruning(3, random_data, enum_patterns_inst, seqmap_inst,
+                                         0.01, 1.0, topk=5)
+            return (PatternMiner(self.pattern_length, 3, [20], enum_patterns_inst,
+                                 pruning_inst, **mining_params),
+                    enum_patterns_inst, pruning_inst)
+
+        with tempfile.TemporaryDirectory() as checkpoint_dir:
+            checkpoint_path = os.path.join(checkpoint_dir, 'checkpoint.npz')
+            for pruning_type in ['apriori', 'bi-dr']:
+                patternminer_inst, enum_patterns_inst, pruning_inst = create_miner(
+                    pruning_type)
+                patternminer_inst.mine()
+
+                # interrupted run, then resumed by new instances from its checkpoint
+                interrupted_inst = create_miner(
+                    pruning_type, max_enumerations=30, checkpoint_path=checkpoint_path,
+                    checkpoint_interval=0)[0]
+                interrupted_inst.mine()
+                self.assertTrue(interrupted_inst.is_partial)
+
+                resumed_inst, resumed_patterns_inst, resumed_pruning_inst = create_miner(
+                    pruning_type, checkpoint_path=checkpoint_path)
+                resumed_inst.resume()
+
+                num_of_patterns = enum_patterns_inst.num_of_patterns
+                self.assertEqual(resumed_patterns_inst.num_of_patterns, num_of_patterns)
+                self.assertListEqual(
+                    resumed_patterns_inst.get_patterns(range(num_of_patterns)),
+                    enum_patterns_inst.get_patterns(range(num_of_patterns)))
+                self.assertTrue(resumed_patterns_inst.get_pattern_metrics(
+                    range(num_of_patterns)).equals(
+                        enum_patterns_inst.get_pattern_metrics(range(num_of_patterns))))
+                self.assertListEqual(
+                    [resumed_patterns_inst.get_pattern_occurences(i) is None
+                     for i in range(num_of_patterns)],
+                    [enum_patterns_inst.get_pattern_occurences(i) is None
+                     for i in range(num_of_patterns)])
+                self.assertEqual(resumed_pruning_inst.num_of_pruned_nodes,
+                                 pruning_inst.num_of_pruned_nodes)
+                self.assertDictEqual(resumed_inst.get_mining_stats(),
+                                     patternminer_inst.get_mining_stats())
+
+            # checkpoints only resume the same mining configuration
+            with self.assertRaises(Exception):
+                create_miner('bi-dr', checkpoint_path=checkpoint_path,
+                             window_order='density')[0].resume()
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,35 @@
+import unittest
+import numpy as np
+from module.utilities import SegmentBoundaries
+
+class TestSegmentBoundaries(unittest.TestCase):
+
+    num_of_readings = 12
+    invalid_seq_indexes = [0, 5, 7, 30]
+    segment_boundaries = SegmentBoundaries(invalid_seq_indexes, num_of_readings)
+
+    def test_crosses(self):
+        # same as checking every index within the segment (start excluded)
+        for start_idx in range(self.num_of_readings):
+            for end_idx in range(start_idx + 1, self.num_of_readings + 1):
+                expected = any(i in self.invalid_seq_indexes
+                               for i in range(start_idx + 1, end_idx))
+                self.assertEqual(self.segment_boundaries.crosses(start_idx, end_idx), expected)
+
+        start_indexes = np.arange(self.num_of_readings - 2)
+        self.assertListEqual(
+            self.segment_boundaries.crosses_all(start_indexes, start_indexes + 3).tolist(),
+            [self.segment_boundaries.crosses(x, x + 3) for x in start_indexes])
+
+    def test_mask_input(self):
+        is_break = np.zeros(self.num_of_readings, dtype=bool)
+        is_break[[5, 7]] = True
+        mask_boundaries = SegmentBoundaries(is_break, self.num_of_readings)
+
+        self.assertListEqual(mask_boundaries.get_segments(), [(0, 5), (5, 7), (7, 12)])
+        self.assertListEqual(self.segment_boundaries.get_segments(), [(0, 5), (5, 7), (7, 12)])
+        self.assertListEqual(SegmentBoundaries([], 4).get_segments(), [(0, 4)])
+
+
+if __name__ == '__main__':
+    unittest.main()